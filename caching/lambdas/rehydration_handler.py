@@ -3,6 +3,7 @@ import json
 import boto3
 from datetime import datetime, timezone
 from botocore.exceptions import ClientError
+from octodb_shared import download_db
 
 dynamodb = boto3.resource('dynamodb')
 s3 = boto3.client('s3')
@@ -54,7 +55,7 @@ def lambda_handler(event, context):
         # Download DB file from S3 to EFS
         print(f"Downloading s3://{source_bucket}/{db_key} to {target_path}")
         try:
-            s3.download_file(source_bucket, db_key, target_path)
+            download_db(s3, source_bucket, db_key, target_path)
         except ClientError as e:
             print(f"ERROR: Failed to download from S3: {e}")
             raise
@@ -1,3 +1,4 @@
+import gzip
 import json
 import boto3
 import sqlite3
@@ -74,7 +75,11 @@ def lambda_handler(event, context):
 
         try:
             schema_obj = s3.get_object(Bucket=PRIMARY_S3_BUCKET, Key=schema_s3_path)
-            schema_sql = schema_obj['Body'].read().decode('utf-8')
+            schema_body = schema_obj['Body'].read()
+            # Schemas rewritten by the migration handler are stored gzip-compressed
+            if schema_body[:2] == b'\x1f\x8b':
+                schema_body = gzip.decompress(schema_body)
+            schema_sql = schema_body.decode('utf-8')
             print(f"Retrieved schema from s3://{PRIMARY_S3_BUCKET}/{schema_s3_path}")
         except s3.exceptions.NoSuchKey:
             return {
@@ -143,7 +148,13 @@ def lambda_handler(event, context):
 
             # hot cold attributes
             'storage_tier': storage_tier,
-            'last_accessed_at': last_accessed_at
+            'last_accessed_at': last_accessed_at,
+
+            # Copy of the replica buckets (Tenant_Name_Index projects all attributes),
+            # so the read/write handlers resolve a tenant with a single query
+            'primary_bucket': PRIMARY_S3_BUCKET,
+            'standby_bucket': STANDBY_S3_BUCKET,
+            'read_only_bucket': READ_ONLY_S3_BUCKET
         })
         print(f"Inserted tenant metadata into DynamoDB")
 
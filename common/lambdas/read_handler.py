@@ -3,10 +3,13 @@ import os
 import json
 import boto3
 import sqlite3
-import tempfile
 from datetime import datetime
 from boto3.dynamodb.conditions import Key
 from botocore.exceptions import ClientError
+from octodb_shared import (
+    api_key_matches, download_tmp_db, dumps, invoke_rehydration, loads, remove_tmp_db, tenant_tmp_path,
+    wait_for_file
+)
 
 s3 = boto3.client('s3')
 dynamodb = boto3.resource('dynamodb')
@@ -18,7 +21,12 @@ TENANT_NAME_INDEX = os.environ.get('TENANT_NAME_INDEX', 'Tenant_Name_Index')
 
 EFS_MOUNT_DIR = os.environ.get('EFS_MOUNT_DIR', '/mnt/efs')
 REHYDRATION_FUNCTION_NAME = os.environ.get('REHYDRATION_FUNCTION_NAME', None)
+REHYDRATION_WAIT_SECONDS = float(os.environ.get('REHYDRATION_WAIT_SECONDS', '5'))
 
+try:
+    import orjson  # provided via Lambda Layer
+except Exception:
+    orjson = None
 
 try:
     import redis  # provided via Lambda Layer
@@ -106,7 +114,7 @@ def _cache_get_json(client, key: str):
         raw = client.get(key)
         if not raw:
             return None
-        return json.loads(raw.decode("utf-8"))
+        return loads(raw)
     except Exception as e:
         print(f"WARNING: Redis cache get failed: {e}")
         return None
@@ -114,7 +122,10 @@ def _cache_get_json(client, key: str):
 
 def _cache_set_json(client, key: str, payload: dict, ttl: int):
     try:
-        data = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+        if orjson is not None:
+            data = orjson.dumps(payload)
+        else:
+            data = json.dumps(payload, separators=(",", ":")).encode("utf-8")
         if len(data) > REDIS_MAX_VALUE_BYTES:
             return
         client.setex(key, ttl, data)
@@ -138,7 +149,7 @@ def lambda_handler(event, context):
         if 'body' not in event:
             return create_response(400, {'error': 'Request body is missing'})
 
-        body = json.loads(event['body']) if isinstance(event['body'], str) else event['body']
+        body = loads(event['body']) if isinstance(event['body'], (str, bytes)) else event['body']
 
         tenant_name = body.get('tenant_name')
         api_key = body.get('api_key')
@@ -168,7 +179,7 @@ def lambda_handler(event, context):
         tenant_item = response['Items'][0]
 
         # Validate API key
-        if tenant_item.get('api_key') != api_key:
+        if not api_key_matches(tenant_item.get('api_key'), api_key):
             return create_response(401, {'error': 'Invalid API key'})
 
         tenant_id = tenant_item.get('tenant_id')
@@ -247,6 +258,8 @@ def lambda_handler(event, context):
                         print(
                             f'Rehydration needed for tenant {tenant_id} in read-handler, calling {REHYDRATION_FUNCTION_NAME}')
                         invoke_rehydration(
+                            lambda_client,
+                            REHYDRATION_FUNCTION_NAME,
                             tenant_id=tenant_id,
                             tenant_name=tenant_name,
                             source_bucket=primary_bucket,
@@ -254,7 +267,11 @@ def lambda_handler(event, context):
                             target_path=efs_db_path,
                             source_type='primary'
                         )
-                        print(f'Rehydration completed for tenant {tenant_id} in read-handler')
+                        # Reads can fall back to the S3 read replica, so only wait briefly
+                        if wait_for_file(efs_db_path, REHYDRATION_WAIT_SECONDS):
+                            print(f'Rehydration completed for tenant {tenant_id} in read-handler')
+                        else:
+                            print(f'Rehydration still running for tenant {tenant_id}, using S3 read replica')
                     except Exception as e:
                         print(f'WARNING: Rehydration invocation failed for tenant {tenant_id} in read-handler: {e}')
                 else:
@@ -312,19 +329,21 @@ def lambda_handler(event, context):
 
         else:
             # Fall back to S3 read replica (cold storage)
-            with tempfile.NamedTemporaryFile(delete=False) as tmp_file:
-                tmp_db_path = tmp_file.name
+            tmp_db_path = tenant_tmp_path(tenant_id)
 
             try:
                 print(f'Downloading database from S3 read replica: {read_only_bucket}/{db_path}')
-                s3.download_file(read_only_bucket, db_path, tmp_db_path)
+                download_tmp_db(s3, read_only_bucket, db_path, tmp_db_path)
             except Exception as e:
+                remove_tmp_db(tmp_db_path)
                 return create_response(500, {
                     'error': f'Failed to download database from S3 read replica: {str(e)}'
                 })
 
             try:
-                conn = sqlite3.connect(tmp_db_path)
+                # Private copy nothing else writes: immutable=1 skips SQLite's locking and
+                # journal/change checks entirely
+                conn = sqlite3.connect(f'file:{tmp_db_path}?mode=ro&immutable=1', uri=True)
                 conn.row_factory = sqlite3.Row
                 cursor = conn.cursor()
                 try:
@@ -368,10 +387,7 @@ def lambda_handler(event, context):
                     'error': f'Database connection error (S3 replica): {str(e)}'
                 })
             finally:
-                try:
-                    os.unlink(tmp_db_path)
-                except Exception:
-                    pass
+                remove_tmp_db(tmp_db_path)
 
     except json.JSONDecodeError:
         return create_response(400, {'error': 'Invalid JSON in request body'})
@@ -379,30 +395,6 @@ def lambda_handler(event, context):
         return create_response(500, {'error': f'Unexpected error: {str(e)}'})
 
 
-def invoke_rehydration(tenant_id, tenant_name, source_bucket, db_key, target_path, source_type):
-    """Invoke the rehydration Lambda synchronously."""
-    if not REHYDRATION_FUNCTION_NAME:
-        raise RuntimeError('REHYDRATION_FUNCTION_NAME is not set')
-
-    payload = {
-        'tenant_id': tenant_id,
-        'tenant_name': tenant_name,
-        'source_bucket': source_bucket,
-        'db_key': db_key,
-        'target_path': target_path,
-        'source_type': source_type
-    }
-
-    resp = lambda_client.invoke(
-        FunctionName=REHYDRATION_FUNCTION_NAME,
-        InvocationType='RequestResponse',
-        Payload=json.dumps(payload).encode('utf-8')
-    )
-
-    if 'FunctionError' in resp:
-        raise RuntimeError(f'Rehydration Lambda returned error: {resp["FunctionError"]}')
-
-
 def create_response(status_code, body):
     return {
         'statusCode': status_code,
@@ -412,5 +404,5 @@ def create_response(status_code, body):
             'Access-Control-Allow-Headers': 'Content-Type,X-Amz-Date,Authorization,X-Api-Key,X-Amz-Security-Token',
             'Access-Control-Allow-Methods': 'POST,OPTIONS'
         },
-        'body': json.dumps(body)
+        'body': dumps(body)
     }
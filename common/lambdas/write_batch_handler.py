@@ -0,0 +1,239 @@
+import os
+import boto3
+import sqlite3
+from octodb_shared import (
+    bump_cache_version, copy_s3_object, db_transfer_config, download_tmp_db, dumps, invoke_rehydration,
+    is_transaction_control, loads, remove_tmp_db, snapshot_name, tenant_tmp_path, utc_isoformat,
+    wait_for_file
+)
+
+# Initialize AWS clients
+s3 = boto3.client('s3')
+dynamodb_client = boto3.client('dynamodb')
+sns = boto3.client('sns')
+lambda_client = boto3.client('lambda')
+
+# Tenant DBs over 8 MB move as 10 concurrent ranged GETs / multipart PUTs
+TRANSFER_CONFIG = db_transfer_config(max_concurrency=10)
+
+# Environment variables
+TENANT_METADATA_TABLE = os.environ.get('TENANT_METADATA_TABLE', 'octodb-tenants')
+REPLICA_METADATA_TABLE = os.environ.get('REPLICA_METADATA_TABLE', 'tenant-metadata')
+SNS_TOPIC_ARN = os.environ.get(
+    'SNS_TOPIC_ARN', 'arn:aws:sns:us-east-1:666802050343:ReplicationStack-WriteTopic-wyk88ACy3a2i'
+)
+EFS_MOUNT_DIR = os.environ.get('EFS_MOUNT_DIR', '/mnt/efs')
+REHYDRATION_FUNCTION_NAME = os.environ.get('REHYDRATION_FUNCTION_NAME')
+REHYDRATION_WAIT_SECONDS = float(os.environ.get('REHYDRATION_WAIT_SECONDS', '5'))
+
+# Entries per SNS PublishBatch call (the API maximum)
+SNS_BATCH_SIZE = 10
+
+def lambda_handler(event, context):
+    """
+    Drains writes queued by the write handler (requests sent with "batch": true).
+
+    Triggered by the FIFO write queue with MessageGroupId=tenant_id, so each
+    tenant's writes arrive in order. All of a tenant's writes in the batch run
+    in one SQLite transaction, followed by a single upload, snapshot and
+    replica metadata update. The SNS notifications of all tenants go out
+    together via PublishBatch once the batch is applied. Enable
+    ReportBatchItemFailures on the event source mapping.
+    """
+    records = event.get('Records', [])
+    print(f'Received event with {len(records)} record(s)')
+
+    # Group records per tenant, keeping queue order within each tenant
+    writes_by_tenant = {}
+    for record in records:
+        try:
+            write = loads(record['body'])
+            if not isinstance(write, dict) or not write.get('tenant_id'):
+                raise ValueError('message has no tenant_id')
+        except ValueError as e:  # json.JSONDecodeError included
+            # Malformed messages can never succeed; drop them instead of retrying
+            print(f'ERROR: Failed to parse message {record.get("messageId")}: {str(e)}')
+            continue
+        write['message_id'] = record['messageId']
+        writes_by_tenant.setdefault(write['tenant_id'], []).append(write)
+
+    batch_item_failures = []
+    notifications = []
+    for tenant_id, writes in writes_by_tenant.items():
+        try:
+            apply_tenant_writes(tenant_id, writes, notifications)
+        except Exception as e:
+            print(f'ERROR: Batched write failed for tenant_id={tenant_id}: {str(e)}')
+            # Retry every write for this tenant so FIFO order is preserved
+            batch_item_failures.extend({'itemIdentifier': w['message_id']} for w in writes)
+        finally:
+            remove_tmp_db(tenant_tmp_path(tenant_id))  # No-op for EFS-backed tenants
+
+    if notifications:
+        publish_notifications(notifications)
+
+    return {'batchItemFailures': batch_item_failures}
+
+
+def apply_tenant_writes(tenant_id, writes, notifications):
+    """Apply one tenant's queued writes; its SNS message is appended to notifications"""
+    first = writes[0]
+    tenant_name = first.get('tenant_name')
+    primary_bucket = first['primary_bucket']
+    db_path = first['db_path']
+    db_key = first.get('db_key') or db_path
+
+    # HOT tenants write through their EFS copy, as the synchronous handler does.
+    # The tier is read now rather than at queue time, since demotion or
+    # rehydration may have run in between.
+    storage_tier = get_storage_tier(tenant_id)
+    use_efs = bool(storage_tier == 'HOT' and EFS_MOUNT_DIR and db_key)
+    efs_db_path = os.path.join(EFS_MOUNT_DIR, db_key) if use_efs else None
+
+    if use_efs and not os.path.exists(efs_db_path):
+        # Rehydrate as the synchronous handler does; nothing else would ever
+        # restore the copy, and the tenant's FIFO group would stay stuck
+        if REHYDRATION_FUNCTION_NAME:
+            try:
+                print(f'Rehydration needed for tenant {tenant_id}, calling {REHYDRATION_FUNCTION_NAME}')
+                os.makedirs(os.path.dirname(efs_db_path), exist_ok=True)
+                invoke_rehydration(
+                    lambda_client,
+                    REHYDRATION_FUNCTION_NAME,
+                    tenant_id=tenant_id,
+                    tenant_name=tenant_name,
+                    source_bucket=primary_bucket,
+                    db_key=db_key,
+                    target_path=efs_db_path,
+                    source_type='primary'
+                )
+            except Exception as e:
+                print(f'WARNING: Rehydration invocation failed for tenant {tenant_id}: {e}')
+                use_efs = False
+
+            if use_efs and not wait_for_file(efs_db_path, REHYDRATION_WAIT_SECONDS):
+                # Writing to S3 now would race the rehydration copying the
+                # pre-write DB onto EFS; the redelivery finds the copy in place
+                raise RuntimeError(f'Rehydration still running for tenant_id={tenant_id}')
+        else:
+            print('REHYDRATION_FUNCTION_NAME not set, falling back to S3')
+            use_efs = False
+
+    if use_efs:
+        db_file_path = efs_db_path
+    else:
+        db_file_path = tenant_tmp_path(tenant_id)
+        print(f'Downloading database from S3: {primary_bucket}/{db_path}')
+        download_tmp_db(s3, primary_bucket, db_path, db_file_path, Config=TRANSFER_CONFIG)
+
+    rows_affected, applied = execute_writes(db_file_path, writes)
+    print(f'Applied {applied}/{len(writes)} queued writes for tenant_id={tenant_id}, rows affected: {rows_affected}')
+    if not applied:
+        return
+
+    print(f'Uploading modified database to S3: {primary_bucket}/{db_path}')
+    s3.upload_file(db_file_path, primary_bucket, db_path, Config=TRANSFER_CONFIG)
+
+    snapshot_filename = snapshot_name(tenant_id)
+    snapshot_s3_key = f'replication_snapshots/{snapshot_filename}'
+    snapshot_size = os.path.getsize(db_file_path)
+    print(f'Copying snapshot in S3: {primary_bucket}/{db_path} -> {snapshot_s3_key}')
+    copy_s3_object(s3, primary_bucket, db_path, snapshot_s3_key, snapshot_size, Config=TRANSFER_CONFIG)
+
+    if SNS_TOPIC_ARN:
+        notifications.append({
+            'Id': str(len(notifications)),  # unique within the batch request
+            'Message': dumps({
+                'tenant_name': tenant_name,
+                'tenant_id': tenant_id,
+                'snapshot_bucket': primary_bucket,
+                'snapshot_s3_key': snapshot_s3_key,
+                'snapshot_filename': snapshot_filename,
+                'snapshot_size': snapshot_size,
+                'primary_bucket': primary_bucket,
+                'db_path': db_path,
+                'read_only_bucket': first.get('read_only_bucket'),
+                'standby_bucket': first.get('standby_bucket'),
+                'timestamp': utc_isoformat(),
+                'rows_affected': rows_affected,
+                'batched_writes': applied,
+                'storage_tier': storage_tier,
+                'db_source': 'EFS' if use_efs else 'S3_PRIMARY'
+            }),
+            'Subject': f'Database Write Notification - {tenant_name}'
+        })
+
+    dynamodb_client.update_item(
+        TableName=REPLICA_METADATA_TABLE,
+        Key={'tenantId': {'S': tenant_id}},
+        UpdateExpression='SET last_updated_at = :timestamp',
+        ExpressionAttributeValues={':timestamp': {'S': utc_isoformat()}}
+    )
+
+    bump_cache_version(tenant_id)
+
+
+def get_storage_tier(tenant_id):
+    resp = dynamodb_client.get_item(
+        TableName=TENANT_METADATA_TABLE,
+        Key={'tenant_id': {'S': tenant_id}},
+        ProjectionExpression='storage_tier',
+        ConsistentRead=True
+    )
+    return (resp.get('Item', {}).get('storage_tier', {}).get('S') or 'COLD').upper()
+
+
+def publish_notifications(entries):
+    """Publish the batch's write notifications SNS_BATCH_SIZE at a time; failures are logged, not raised"""
+    for start in range(0, len(entries), SNS_BATCH_SIZE):
+        chunk = entries[start:start + SNS_BATCH_SIZE]
+        try:
+            resp = sns.publish_batch(TopicArn=SNS_TOPIC_ARN, PublishBatchRequestEntries=chunk)
+        except Exception as e:
+            print(f'ERROR: Failed to publish to SNS: {str(e)}')
+            continue
+        for failed in resp.get('Failed', []):
+            print(f'ERROR: Failed to publish SNS message {failed["Id"]}: {failed.get("Message")}')
+        print(f'{len(resp.get("Successful", []))}/{len(chunk)} SNS message(s) published')
+
+
+def execute_writes(db_file_path, writes):
+    """
+    Run the queued statements in a single transaction. Each statement gets its
+    own savepoint so one bad statement is rolled back and logged without
+    discarding the rest of the batch (retrying it would fail the same way).
+    Transaction control statements are skipped: they would end the batch's
+    transaction and savepoint (the write handlers refuse to queue them).
+    """
+    rows_affected = 0
+    applied = 0
+    conn = sqlite3.connect(db_file_path)
+    try:
+        conn.execute('BEGIN')
+        for write in writes:
+            if is_transaction_control(write['sql_query']):
+                print(f'ERROR: Queued write {write["message_id"]} is a transaction control statement and was skipped')
+                continue
+            conn.execute('SAVEPOINT queued_write')
+            try:
+                cursor = conn.execute(write['sql_query'], write.get('params') or ())
+                if not conn.in_transaction:
+                    # Ended the transaction anyway; what ran so far is settled, so
+                    # carry on in a new one rather than fail and redeliver the group
+                    print(f'ERROR: Queued write {write["message_id"]} ended the batch transaction')
+                    conn.execute('BEGIN')
+                    continue
+                conn.execute('RELEASE queued_write')
+                rows_affected += max(cursor.rowcount, 0)
+                applied += 1
+            except sqlite3.Error as e:
+                print(f'ERROR: Queued write {write["message_id"]} failed and was skipped: {str(e)}')
+                conn.execute('ROLLBACK TO queued_write')
+                conn.execute('RELEASE queued_write')
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    return rows_affected, applied
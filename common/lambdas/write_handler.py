@@ -2,15 +2,37 @@ import os
 import json
 import boto3
 import sqlite3
-import tempfile
-from datetime import datetime
-from boto3.dynamodb.conditions import Key
+import uuid
+from collections import OrderedDict
+from boto3.dynamodb.types import TypeDeserializer
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
+from octodb_shared import (
+    api_key_matches, bump_cache_version, copy_s3_object, download_tmp_db, dumps, invoke_rehydration,
+    is_transaction_control, loads, remove_tmp_db, snapshot_name, tenant_tmp_path, utc_isoformat,
+    wait_for_file
+)
 
 # Initialize AWS clients
 s3 = boto3.client('s3')
-dynamodb = boto3.resource('dynamodb')
+# Low-level client: skips the resource layer's marshalling and keeps TLS connections alive
+dynamodb_client = boto3.client('dynamodb', config=Config(
+    tcp_keepalive=True,
+    max_pool_connections=50,
+    retries={'mode': 'adaptive', 'total_max_attempts': 2}
+))
 sns = boto3.client('sns')
 lambda_client = boto3.client('lambda')
+sqs = boto3.client('sqs')
+
+_deserializer = TypeDeserializer()
+
+# Split large DB transfers into concurrent ranged GETs / multipart PUTs
+TRANSFER_CONFIG = TransferConfig(
+    multipart_threshold=int(os.environ.get('S3_MULTIPART_THRESHOLD_MB', '16')) * 1024 * 1024,
+    multipart_chunksize=int(os.environ.get('S3_MULTIPART_CHUNKSIZE_MB', '8')) * 1024 * 1024,
+    max_concurrency=int(os.environ.get('S3_MAX_CONCURRENCY', '8'))
+)
 
 # Environment variables
 TENANT_METADATA_TABLE = os.environ.get('TENANT_METADATA_TABLE', 'octodb-tenants')
@@ -23,68 +45,75 @@ SNS_TOPIC_ARN = os.environ.get(
 # env vars for AccessTenant / hot cold logic
 EFS_MOUNT_DIR = os.environ.get('EFS_MOUNT_DIR', '/mnt/efs')
 REHYDRATION_FUNCTION_NAME = os.environ.get('REHYDRATION_FUNCTION_NAME')
+# Stays well under API Gateway's 29 s integration timeout, so the client gets
+# the 503 below rather than a gateway 504
+REHYDRATION_WAIT_SECONDS = float(os.environ.get('REHYDRATION_WAIT_SECONDS', '5'))
+
+# FIFO queue drained by write_batch_handler; requests with "batch": true are queued
+# there so bursts of writes to one tenant share a single download/upload.
+# QUEUED_WRITES makes that the default for requests that don't say either way.
+WRITE_QUEUE_URL = os.environ.get('WRITE_QUEUE_URL')
+QUEUED_WRITES = os.environ.get('QUEUED_WRITES', 'false').lower() == 'true'
+
+# Lifetime of the pre-signed snapshot URL handed to clients and replicas. Opt-in
+# (0 disables): the URL grants read access to the tenant's whole DB.
+SNAPSHOT_URL_EXPIRY_SECONDS = int(os.environ.get('SNAPSHOT_URL_EXPIRY_SECONDS', '0'))
+
+SNS_PREFIX_CACHE_SIZE = int(os.environ.get('SNS_PREFIX_CACHE_SIZE', '1024'))
+
+# Serialized per-tenant fields of the SNS message, keyed by their values
+_sns_prefix_cache = {}
 
 # ------------------------
-# Redis (ElastiCache) invalidation
+# EFS connection cache (reused across warm invocations)
 # ------------------------
-try:
-    import redis  # provided via Lambda Layer
-except Exception:
-    redis = None
-
-REDIS_ENABLED = os.environ.get("REDIS_ENABLED", "false").lower() == "true"
-REDIS_HOST = os.environ.get("REDIS_HOST")
-REDIS_PORT = int(os.environ.get("REDIS_PORT", "6379"))
-REDIS_TLS = os.environ.get("REDIS_TLS", "false").lower() == "true"
-REDIS_AUTH_TOKEN = os.environ.get("REDIS_AUTH_TOKEN")
-REDIS_CONNECT_TIMEOUT_MS = int(os.environ.get("REDIS_CONNECT_TIMEOUT_MS", "50"))
-REDIS_SOCKET_TIMEOUT_MS = int(os.environ.get("REDIS_SOCKET_TIMEOUT_MS", "50"))
-
-_redis_client = None
-
-
-def _get_redis_client():
-    global _redis_client
-    if _redis_client is not None:
-        return _redis_client
-    if not (REDIS_ENABLED and redis and REDIS_HOST):
-        _redis_client = None
-        return None
-    try:
-        kwargs = dict(
-            host=REDIS_HOST,
-            port=REDIS_PORT,
-            socket_connect_timeout=REDIS_CONNECT_TIMEOUT_MS / 1000.0,
-            socket_timeout=REDIS_SOCKET_TIMEOUT_MS / 1000.0,
-            decode_responses=False,
-        )
-        if REDIS_TLS:
-            kwargs["ssl"] = True
-        if REDIS_AUTH_TOKEN:
-            kwargs["password"] = REDIS_AUTH_TOKEN
-        client = redis.Redis(**kwargs)
-        client.ping()
-        _redis_client = client
-        return client
-    except Exception as e:
-        print(f"WARNING: Redis invalidation disabled/unreachable: {e}")
-        _redis_client = None
-        return None
-
+EFS_CONN_CACHE_SIZE = int(os.environ.get("EFS_CONN_CACHE_SIZE", "8"))
+EFS_CACHE_SIZE_KIB = int(os.environ.get("EFS_CACHE_SIZE_KIB", "65536"))
+EFS_CACHED_STATEMENTS = int(os.environ.get("EFS_CACHED_STATEMENTS", "256"))
 
-def _tenant_ver_key(tenant_id: str) -> str:
-    return f"octodb:tenant:{tenant_id}:ver"
+_efs_conn_cache = OrderedDict()
 
 
-def bump_cache_version(tenant_id: str):
-    client = _get_redis_client()
-    if not client or not tenant_id:
+def _close_efs_connection(key):
+    entry = _efs_conn_cache.pop(key, None)
+    if entry is None:
         return
     try:
-        client.incr(_tenant_ver_key(tenant_id))
-        print(f"Redis cache version bumped for tenant_id={tenant_id}")
+        entry[0].close()
     except Exception as e:
-        print(f"WARNING: Redis cache version bump failed: {e}")
+        print(f"WARNING: Failed to close cached EFS connection {key}: {e}")
+
+
+def get_efs_connection(tenant_id: str, efs_db_path: str) -> sqlite3.Connection:
+    """
+    Return an open connection to the tenant DB on EFS, reusing the one from a
+    previous invocation when the file has not been replaced since (rehydration
+    and demotion swap or remove the file, which changes its inode).
+    """
+    key = (tenant_id, efs_db_path)
+    entry = _efs_conn_cache.get(key)
+    if entry is not None:
+        conn, inode = entry
+        try:
+            if os.stat(efs_db_path).st_ino == inode:
+                conn.execute("SELECT 1")
+                _efs_conn_cache.move_to_end(key)
+                return conn
+        except Exception as e:
+            print(f"WARNING: Cached EFS connection for tenant_id={tenant_id} is stale: {e}")
+        _close_efs_connection(key)
+
+    # Warm connections see the same write shapes repeatedly; keep more of them prepared
+    conn = sqlite3.connect(efs_db_path, cached_statements=EFS_CACHED_STATEMENTS)
+    # WAL needs shared memory between processes, which EFS (NFS) cannot provide
+    # across Lambda containers, so keep the rollback journal and only grow the cache.
+    conn.execute(f"PRAGMA cache_size = -{EFS_CACHE_SIZE_KIB}")
+    _efs_conn_cache[key] = (conn, os.stat(efs_db_path).st_ino)
+
+    while len(_efs_conn_cache) > EFS_CONN_CACHE_SIZE:
+        _close_efs_connection(next(iter(_efs_conn_cache)))
+
+    return conn
 
 
 def lambda_handler(event, context):
@@ -93,11 +122,12 @@ def lambda_handler(event, context):
             print('ERROR: Request body is missing')
             return create_response(400, {'error': 'Request body is missing'})
 
-        body = json.loads(event['body']) if isinstance(event['body'], str) else event['body']
+        body = loads(event['body']) if isinstance(event['body'], (str, bytes)) else event['body']
 
         tenant_name = body.get('tenant_name')
         api_key = body.get('api_key')
         sql_query = body.get('sql_query')
+        params = body.get('params')
 
         if not tenant_name or not api_key or not sql_query:
             print('ERROR: Missing required fields in request')
@@ -105,15 +135,45 @@ def lambda_handler(event, context):
                 'error': 'Missing required fields. Please provide tenant_name, api_key, and sql_query'
             })
 
+        # Validate the statement shape before any metadata lookup or download
+        if params is None:
+            params = ()
+        elif not isinstance(params, (list, dict)):
+            print('ERROR: Invalid params in request')
+            return create_response(400, {
+                'error': 'params must be a list (positional) or an object (named)'
+            })
+
+        if not isinstance(sql_query, str) or not sqlite3.complete_statement(sql_query + ';'):
+            print('ERROR: Incomplete SQL statement in request')
+            return create_response(400, {
+                'error': 'sql_query is not a complete SQL statement'
+            })
+
+        # Strict bool: a string such as "false" must not queue the write
+        queue_write = body.get('batch', QUEUED_WRITES)
+        if not isinstance(queue_write, bool):
+            print('ERROR: Invalid batch flag in request')
+            return create_response(400, {
+                'error': 'batch must be true or false'
+            })
+
+        # The batch handler runs queued writes inside its own transaction
+        if queue_write and WRITE_QUEUE_URL and is_transaction_control(sql_query):
+            print('ERROR: Transaction control statement in queued write')
+            return create_response(400, {
+                'error': 'Transaction control statements (BEGIN, COMMIT, ROLLBACK, ...) cannot be queued'
+            })
+
         print(f'Processing write request for tenant: {tenant_name}')
 
         # Step 1: tenant lookup and API key validation
-        tenant_table = dynamodb.Table(TENANT_METADATA_TABLE)
-
         try:
-            response = tenant_table.query(
+            response = dynamodb_client.query(
+                TableName=TENANT_METADATA_TABLE,
                 IndexName=TENANT_NAME_INDEX,
-                KeyConditionExpression=Key('tenant_name').eq(tenant_name)
+                KeyConditionExpression='tenant_name = :name',
+                ExpressionAttributeValues={':name': {'S': tenant_name}}
             )
         except Exception as e:
             print(f'ERROR: Failed to query tenant metadata: {str(e)}')
@@ -127,9 +187,9 @@ def lambda_handler(event, context):
                 'error': f'Tenant "{tenant_name}" not found'
             })
 
-        tenant_item = response['Items'][0]
+        tenant_item = from_ddb_item(response['Items'][0])
 
-        if tenant_item.get('api_key') != api_key:
+        if not api_key_matches(tenant_item.get('api_key'), api_key):
             print(f'WARNING: Invalid API key for tenant: {tenant_name}')
             return create_response(401, {
                 'error': 'Invalid API key'
@@ -145,11 +205,10 @@ def lambda_handler(event, context):
         print(f'Tenant ID retrieved: {tenant_id}')
 
         # Step 2: replica metadata
-        replica_table = dynamodb.Table(REPLICA_METADATA_TABLE)
-
         try:
-            replica_response = replica_table.get_item(
-                Key={'tenantId': tenant_id}
+            replica_response = dynamodb_client.get_item(
+                TableName=REPLICA_METADATA_TABLE,
+                Key={'tenantId': {'S': tenant_id}}
             )
         except Exception as e:
             print(f'ERROR: Failed to query replica metadata: {str(e)}')
@@ -163,7 +222,7 @@ def lambda_handler(event, context):
                 'error': f'Replica metadata not found for tenant_id "{tenant_id}"'
             })
 
-        replica_item = replica_response['Item']
+        replica_item = from_ddb_item(replica_response['Item'])
         primary_bucket = replica_item.get('primary_bucket')
         read_only_bucket = replica_item.get('read_only_bucket')
         standby_bucket = replica_item.get('standby_bucket')
@@ -181,7 +240,35 @@ def lambda_handler(event, context):
         storage_tier = (tenant_item.get('storage_tier') or 'COLD').upper()
         db_key = tenant_item.get('current_db_path') or db_path
 
-        update_last_accessed(tenant_table, tenant_id)
+        update_last_accessed(tenant_id)
+
+        if queue_write and WRITE_QUEUE_URL:
+            try:
+                message_id = enqueue_write(
+                    tenant_id=tenant_id,
+                    tenant_name=tenant_name,
+                    sql_query=sql_query,
+                    params=params,
+                    db_key=db_key,
+                    primary_bucket=primary_bucket,
+                    db_path=db_path,
+                    read_only_bucket=read_only_bucket,
+                    standby_bucket=standby_bucket
+                )
+            except Exception as e:
+                print(f'ERROR: Failed to queue write: {str(e)}')
+                return create_response(500, {
+                    'error': f'Failed to queue write: {str(e)}'
+                })
+
+            print(f'Write queued for tenant: {tenant_name} (message {message_id})')
+            return create_response(202, {
+                'success': True,
+                'message': 'Write queued for batched execution',
+                'message_id': message_id,
+                'storage_tier': storage_tier,
+                'region': 'us-east-1'
+            })
 
         use_efs = bool(
             storage_tier == 'HOT' and
@@ -199,6 +286,8 @@ def lambda_handler(event, context):
                     try:
                         print(f'Rehydration needed for tenant {tenant_id}, calling {REHYDRATION_FUNCTION_NAME}')
                         invoke_rehydration(
+                            lambda_client,
+                            REHYDRATION_FUNCTION_NAME,
                             tenant_id=tenant_id,
                             tenant_name=tenant_name,
                             source_bucket=primary_bucket,
@@ -206,26 +295,33 @@ def lambda_handler(event, context):
                             target_path=efs_db_path,
                             source_type='primary'
                         )
-                        print(f'Rehydration completed for tenant {tenant_id}')
                     except Exception as e:
                         print(f'WARNING: Rehydration invocation failed for tenant {tenant_id}: {e}')
                         use_efs = False
+
+                    if use_efs:
+                        if not wait_for_file(efs_db_path, REHYDRATION_WAIT_SECONDS):
+                            # Falling back to S3 here would race the rehydration copying the
+                            # pre-write DB onto EFS, so let the client retry instead
+                            print(f'WARNING: Rehydration still running for tenant {tenant_id}')
+                            return create_response(503, {
+                                'error': 'Tenant database is being rehydrated, please retry'
+                            })
+                        print(f'Rehydration completed for tenant {tenant_id}')
                 else:
                     print('REHYDRATION_FUNCTION_NAME not set, falling back to S3')
                     use_efs = False
 
         tmp_db_path = None
-        snapshot_path = None
 
         try:
-            # If not using EFS, create temp file and download DB from S3
+            # If not using EFS, download DB from S3 to the tenant's /tmp path
             if not use_efs:
-                with tempfile.NamedTemporaryFile(delete=False, suffix='.db') as tmp_file:
-                    tmp_db_path = tmp_file.name
+                tmp_db_path = tenant_tmp_path(tenant_id)
 
                 print(f'Downloading database from S3: {primary_bucket}/{db_path}')
                 try:
-                    s3.download_file(primary_bucket, db_path, tmp_db_path)
+                    download_tmp_db(s3, primary_bucket, db_path, tmp_db_path, Config=TRANSFER_CONFIG)
                 except Exception as e:
                     print(f'ERROR: Failed to download database from S3: {str(e)}')
                     return create_response(500, {
@@ -236,32 +332,31 @@ def lambda_handler(event, context):
 
             # Step 3: execute write query
             try:
-                conn = sqlite3.connect(db_file_path)
+                if use_efs and efs_db_path:
+                    conn = get_efs_connection(tenant_id, efs_db_path)
+                else:
+                    conn = sqlite3.connect(db_file_path)
                 cursor = conn.cursor()
 
                 try:
                     print(f'Executing SQL query: {sql_query[:100]}...')
-                    cursor.execute(sql_query)
+                    cursor.execute(sql_query, params)
                     conn.commit()
                     rows_affected = cursor.rowcount
                     print(f'SQL query executed successfully. Rows affected: {rows_affected}')
 
-                    # Create snapshot using VACUUM INTO
-                    timestamp = datetime.utcnow().strftime('%Y%m%d_%H%M%S')
-                    snapshot_filename = f'{tenant_id}_snapshot_{timestamp}.db'
-                    snapshot_path = f'/tmp/{snapshot_filename}'
-
-                    print(f'Creating database snapshot: {snapshot_path}')
-                    cursor.execute(f"VACUUM INTO '{snapshot_path}'")
-
+                    snapshot_filename = snapshot_name(tenant_id)
                 except sqlite3.Error as e:
                     print(f'ERROR: SQL query execution failed: {str(e)}')
+                    conn.rollback()
                     return create_response(400, {
                         'error': f'SQL query execution failed: {str(e)}'
                     })
                 finally:
                     cursor.close()
-                    conn.close()
+                    # EFS connections stay open for the next warm invocation
+                    if not use_efs:
+                        conn.close()
 
             except Exception as e:
                 print(f'ERROR: Database connection error: {str(e)}')
@@ -271,20 +366,21 @@ def lambda_handler(event, context):
 
             # Step 4: upload modified database to primary bucket
             try:
-                source_path = efs_db_path if use_efs and efs_db_path else tmp_db_path
                 print(f'Uploading modified database to S3: {primary_bucket}/{db_path}')
-                s3.upload_file(source_path, primary_bucket, db_path)
+                s3.upload_file(db_file_path, primary_bucket, db_path, Config=TRANSFER_CONFIG)
             except Exception as e:
                 print(f'ERROR: Failed to upload modified database to S3: {str(e)}')
                 return create_response(500, {
                     'error': f'Failed to upload modified database to S3: {str(e)}'
                 })
 
-            # Upload snapshot to S3 in replication_snapshots folder
+            # Snapshot into the replication_snapshots folder. The full DB was just
+            # uploaded, so copy it server-side instead of pushing the bytes again.
             snapshot_s3_key = f'replication_snapshots/{snapshot_filename}'
             try:
-                print(f'Uploading snapshot to S3: {primary_bucket}/{snapshot_s3_key}')
-                s3.upload_file(snapshot_path, primary_bucket, snapshot_s3_key)
+                snapshot_size = os.path.getsize(db_file_path)
+                print(f'Copying snapshot in S3: {primary_bucket}/{db_path} -> {snapshot_s3_key}')
+                copy_s3_object(s3, primary_bucket, db_path, snapshot_s3_key, snapshot_size, Config=TRANSFER_CONFIG)
                 print('Snapshot uploaded to S3 successfully')
             except Exception as e:
                 print(f'ERROR: Failed to upload snapshot to S3: {str(e)}')
@@ -292,29 +388,37 @@ def lambda_handler(event, context):
                     'error': f'Failed to upload snapshot to S3: {str(e)}'
                 })
 
+            snapshot_url = presign_snapshot(primary_bucket, snapshot_s3_key)
+
             # Step 5: SNS notification
             if SNS_TOPIC_ARN:
                 try:
-                    sns_message = {
-                        'tenant_name': tenant_name,
-                        'tenant_id': tenant_id,
-                        'snapshot_bucket': primary_bucket,
-                        'snapshot_s3_key': snapshot_s3_key,
-                        'snapshot_filename': snapshot_filename,
-                        'primary_bucket': primary_bucket,
-                        'db_path': db_path,
-                        'read_only_bucket': read_only_bucket,
-                        'standby_bucket': standby_bucket,
-                        'timestamp': datetime.utcnow().isoformat(),
-                        'rows_affected': rows_affected,
-                        'storage_tier': storage_tier,
-                        'db_source': 'EFS' if use_efs else 'S3_PRIMARY'
-                    }
+                    sns_message = build_sns_message(
+                        {
+                            'tenant_name': tenant_name,
+                            'tenant_id': tenant_id,
+                            'snapshot_bucket': primary_bucket,
+                            'primary_bucket': primary_bucket,
+                            'db_path': db_path,
+                            'read_only_bucket': read_only_bucket,
+                            'standby_bucket': standby_bucket
+                        },
+                        {
+                            'snapshot_s3_key': snapshot_s3_key,
+                            'snapshot_filename': snapshot_filename,
+                            'snapshot_size': snapshot_size,
+                            'timestamp': utc_isoformat(),
+                            'rows_affected': rows_affected,
+                            'storage_tier': storage_tier,
+                            'db_source': 'EFS' if use_efs else 'S3_PRIMARY',
+                            'snapshot_url': snapshot_url
+                        }
+                    )
 
                     print(f'Publishing message to SNS topic: {SNS_TOPIC_ARN}')
                     sns.publish(
                         TopicArn=SNS_TOPIC_ARN,
-                        Message=json.dumps(sns_message),
+                        Message=sns_message,
                         Subject=f'Database Write Notification - {tenant_name}'
                     )
                     print('SNS message published successfully')
@@ -324,14 +428,15 @@ def lambda_handler(event, context):
 
             # Step 6: update replica metadata last_updated_at
             try:
-                current_timestamp = datetime.utcnow().isoformat()
+                current_timestamp = utc_isoformat()
                 print(f'Updating replica metadata with last_updated_at: {current_timestamp}')
 
-                replica_table.update_item(
-                    Key={'tenantId': tenant_id},
+                dynamodb_client.update_item(
+                    TableName=REPLICA_METADATA_TABLE,
+                    Key={'tenantId': {'S': tenant_id}},
                     UpdateExpression='SET last_updated_at = :timestamp',
                     ExpressionAttributeValues={
-                        ':timestamp': current_timestamp
+                        ':timestamp': {'S': current_timestamp}
                     }
                 )
                 print('Replica metadata updated successfully')
@@ -351,6 +456,7 @@ def lambda_handler(event, context):
                 'rows_affected': rows_affected,
                 'snapshot_created': snapshot_filename,
                 'snapshot_s3_key': snapshot_s3_key,
+                'snapshot_url': snapshot_url,
                 'last_updated_at': current_timestamp,
                 'storage_tier': storage_tier,
                 'db_source': 'EFS' if use_efs else 'S3_PRIMARY',
@@ -358,19 +464,9 @@ def lambda_handler(event, context):
             })
 
         finally:
-            if tmp_db_path and os.path.exists(tmp_db_path):
-                try:
-                    os.unlink(tmp_db_path)
-                    print('Temporary database file cleaned up')
-                except Exception as e:
-                    print(f'WARNING: Failed to delete temporary file {tmp_db_path}: {str(e)}')
-
-            if snapshot_path and os.path.exists(snapshot_path):
-                try:
-                    os.unlink(snapshot_path)
-                    print('Temporary snapshot file cleaned up')
-                except Exception as e:
-                    print(f'WARNING: Failed to delete temporary snapshot file {snapshot_path}: {str(e)}')
+            if tmp_db_path:
+                remove_tmp_db(tmp_db_path)
+                print('Temporary database file cleaned up')
 
     except json.JSONDecodeError as e:
         print(f'ERROR: Invalid JSON in request body: {str(e)}')
@@ -384,39 +480,78 @@ def lambda_handler(event, context):
         })
 
 
-def update_last_accessed(tenant_table, tenant_id):
+def build_sns_message(tenant_fields, write_fields):
+    """
+    Serialize the SNS write notification. The tenant fields are the same on
+    every write for a tenant, so their JSON is cached and only the per-write
+    fields are serialized on each call.
+    """
+    key = tuple(tenant_fields.values())
+    prefix = _sns_prefix_cache.get(key)
+    if prefix is None:
+        if len(_sns_prefix_cache) >= SNS_PREFIX_CACHE_SIZE:
+            _sns_prefix_cache.clear()
+        prefix = dumps(tenant_fields)[:-1]
+        _sns_prefix_cache[key] = prefix
+    return prefix + ',' + dumps(write_fields)[1:]
+
+
+def from_ddb_item(item):
+    return {k: _deserializer.deserialize(v) for k, v in item.items()}
+
+
+def update_last_accessed(tenant_id):
     try:
-        now = datetime.utcnow().isoformat()
-        tenant_table.update_item(
-            Key={'tenant_id': tenant_id},
+        now = utc_isoformat()
+        dynamodb_client.update_item(
+            TableName=TENANT_METADATA_TABLE,
+            Key={'tenant_id': {'S': tenant_id}},
             UpdateExpression='SET last_accessed_at = :ts',
-            ExpressionAttributeValues={':ts': now}
+            ExpressionAttributeValues={':ts': {'S': now}}
         )
     except Exception as e:
         print(f'WARNING: Failed to update last_accessed_at for tenant {tenant_id}: {e}')
 
 
-def invoke_rehydration(tenant_id, tenant_name, source_bucket, db_key, target_path, source_type):
-    if not REHYDRATION_FUNCTION_NAME:
-        raise RuntimeError('REHYDRATION_FUNCTION_NAME is not configured')
+def presign_snapshot(bucket, key):
+    """
+    Pre-signed GET URL for a snapshot, so clients and replicas can fetch the
+    result DB straight from S3 instead of through another Lambda. Signing is
+    local; no request is made to S3.
+    """
+    if SNAPSHOT_URL_EXPIRY_SECONDS <= 0:
+        return None
+    try:
+        return s3.generate_presigned_url(
+            'get_object',
+            Params={'Bucket': bucket, 'Key': key},
+            ExpiresIn=SNAPSHOT_URL_EXPIRY_SECONDS
+        )
+    except Exception as e:
+        print(f'WARNING: Failed to pre-sign snapshot URL: {e}')
+        return None
 
-    payload = {
-        'tenant_id': tenant_id,
-        'tenant_name': tenant_name,
-        'source_bucket': source_bucket,
-        'db_key': db_key,
-        'target_path': target_path,
-        'source_type': source_type
-    }
 
-    resp = lambda_client.invoke(
-        FunctionName=REHYDRATION_FUNCTION_NAME,
-        InvocationType='RequestResponse',
-        Payload=json.dumps(payload).encode('utf-8')
+def enqueue_write(tenant_id, tenant_name, sql_query, params, db_key,
+                  primary_bucket, db_path, read_only_bucket, standby_bucket):
+    resp = sqs.send_message(
+        QueueUrl=WRITE_QUEUE_URL,
+        MessageBody=dumps({
+            'tenant_id': tenant_id,
+            'tenant_name': tenant_name,
+            'sql_query': sql_query,
+            'params': params,
+            'db_key': db_key,
+            'primary_bucket': primary_bucket,
+            'db_path': db_path,
+            'read_only_bucket': read_only_bucket,
+            'standby_bucket': standby_bucket
+        }),
+        # One group per tenant keeps that tenant's writes in order
+        MessageGroupId=tenant_id,
+        MessageDeduplicationId=uuid.uuid4().hex
     )
-
-    if 'FunctionError' in resp:
-        raise RuntimeError(f'Rehydration Lambda returned error: {resp["FunctionError"]}')
+    return resp['MessageId']
 
 
 def create_response(status_code, body):
@@ -428,5 +563,5 @@ def create_response(status_code, body):
             'Access-Control-Allow-Headers': 'Content-Type,X-Amz-Date,Authorization,X-Api-Key,X-Amz-Security-Token',
             'Access-Control-Allow-Methods': 'POST,OPTIONS'
         },
-        'body': json.dumps(body)
+        'body': dumps(body)
     }
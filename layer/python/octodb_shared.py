@@ -0,0 +1,335 @@
+'''
+Helpers shared by the OctoDB Lambdas. Deployed as a Lambda Layer: python/
+is the root of the layer zip, so every handler can `import octodb_shared`.
+'''
+import os
+import re
+import json
+import hmac
+import hashlib
+import time
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
+
+try:
+    import orjson  # provided via Lambda Layer
+except Exception:
+    orjson = None
+
+try:
+    import zstandard  # provided via Lambda Layer
+except Exception:
+    zstandard = None
+
+try:
+    import redis  # provided via Lambda Layer
+except Exception:
+    redis = None
+
+# Replication handler clients: kept-alive connections so warm invocations skip
+# the TCP/TLS handshake, and bounded retries
+CLIENT_CONFIG = Config(
+    max_pool_connections=10,
+    tcp_keepalive=True,
+    retries={'max_attempts': 3, 'mode': 'standard'}
+)
+
+# Tenant DBs move in 8 MB parts; the write handlers' upload_etag relies on it
+DB_PART_BYTES = 8 * 1024 * 1024
+
+# Optional signed tenant tokens: clients send auth_token = hex HMAC-SHA256 of
+# tenant_name under this secret, verified in-process. Without AUTH_TOKEN_REQUIRED,
+# requests that omit the token fall through to the API key check alone.
+AUTH_TOKEN_SECRET = os.environ.get('AUTH_TOKEN_SECRET', '').encode('utf-8')
+AUTH_TOKEN_REQUIRED = os.environ.get('AUTH_TOKEN_REQUIRED', 'false').lower() == 'true'
+
+# Statements that begin, end or nest a transaction. Queued writes run inside
+# the batch handler's own transaction and savepoints, so these can't be queued.
+# Leading whitespace and comments are skipped as SQLite does.
+TRANSACTION_CONTROL = re.compile(
+    r'(?:\s|--[^\n]*|/\*.*?\*/)*(?:BEGIN|COMMIT|END|ROLLBACK|SAVEPOINT|RELEASE)\b',
+    re.IGNORECASE | re.DOTALL
+)
+
+# S3-backed DBs are staged at a fixed per-tenant path in /tmp for the length of
+# one invocation, then removed so /tmp never fills up across warm invocations
+TMP_DB_DIR = '/tmp'
+
+# Tenant DBs uploaded with DB_COMPRESSION=zstd carry this ContentEncoding
+ZSTD_ENCODING = 'zstd'
+# Set the same DB_COMPRESSION on every function that downloads tenant DBs.
+# Without it download_db assumes plain objects and skips the HeadObject that
+# would look up the ContentEncoding.
+DB_COMPRESSED = os.environ.get('DB_COMPRESSION', '').lower() == ZSTD_ENCODING
+# The frame header (at most 18 bytes) records the decompressed size
+ZSTD_FRAME_HEADER_MAX_BYTES = 18
+ZSTD_READ_CHUNK_BYTES = 1024 * 1024
+
+# CopyObject is capped at 5 GB; larger objects go through the managed copy
+COPY_OBJECT_MAX_BYTES = 5 * 1024 ** 3
+
+# Redis (ElastiCache) read cache, invalidated by bumping the tenant's version
+REDIS_ENABLED = os.environ.get('REDIS_ENABLED', 'false').lower() == 'true'
+REDIS_HOST = os.environ.get('REDIS_HOST')
+REDIS_PORT = int(os.environ.get('REDIS_PORT', '6379'))
+REDIS_TLS = os.environ.get('REDIS_TLS', 'false').lower() == 'true'
+REDIS_AUTH_TOKEN = os.environ.get('REDIS_AUTH_TOKEN')
+REDIS_CONNECT_TIMEOUT_MS = int(os.environ.get('REDIS_CONNECT_TIMEOUT_MS', '50'))
+REDIS_SOCKET_TIMEOUT_MS = int(os.environ.get('REDIS_SOCKET_TIMEOUT_MS', '50'))
+
+_redis_client = None
+
+# Last formatted UTC second, reused by utc_isoformat within the same second
+_iso_second = [None, None]
+
+
+def db_transfer_config(max_concurrency):
+    '''Tenant DBs over DB_PART_BYTES move as max_concurrency concurrent ranged GETs / multipart PUTs'''
+    return TransferConfig(
+        multipart_threshold=DB_PART_BYTES,
+        multipart_chunksize=DB_PART_BYTES,
+        max_concurrency=max_concurrency,
+        use_threads=True
+    )
+
+
+def utc_isoformat(ns=None):
+    '''
+    Same output as datetime.utcnow().isoformat() (with microseconds), built
+    from time.time_ns() and a cached per-second 'YYYY-MM-DDTHH:MM:SS' prefix.
+    '''
+    if ns is None:
+        ns = time.time_ns()
+    seconds, remainder = divmod(ns, 1_000_000_000)
+    if _iso_second[0] != seconds:
+        _iso_second[0] = seconds
+        _iso_second[1] = time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(seconds))
+    return f'{_iso_second[1]}.{remainder // 1000:06d}'
+
+
+def snapshot_name(tenant_id, ns=None):
+    '''Replication snapshot file name; the nanosecond epoch is unique per write and sorts chronologically'''
+    if ns is None:
+        ns = time.time_ns()
+    return f'{tenant_id}_snapshot_{ns}.db'
+
+
+def loads(data):
+    '''Parse JSON with orjson when the layer provides it (its errors subclass JSONDecodeError)'''
+    if orjson:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def dumps(obj):
+    '''JSON-encode a message or response body, with orjson when the layer provides it'''
+    if orjson:
+        return orjson.dumps(obj).decode('utf-8')
+    return json.dumps(obj)
+
+
+def auth_token_valid(tenant_name, token):
+    '''Check the request's signed tenant token locally (always true when no secret is configured)'''
+    if not AUTH_TOKEN_SECRET:
+        return True
+    if not token:
+        return not AUTH_TOKEN_REQUIRED
+    expected = hmac.new(AUTH_TOKEN_SECRET, str(tenant_name).encode('utf-8'), hashlib.sha256).hexdigest()
+    return hmac.compare_digest(expected.encode('utf-8'), str(token).encode('utf-8'))
+
+
+def api_key_matches(expected, provided):
+    '''Constant-time comparison of the tenant's stored API key with the one sent'''
+    if not expected or not provided:
+        return False
+    return hmac.compare_digest(str(expected).encode('utf-8'), str(provided).encode('utf-8'))
+
+
+def is_transaction_control(sql):
+    '''Whether sql is a BEGIN/COMMIT/END/ROLLBACK/SAVEPOINT/RELEASE statement'''
+    return bool(TRANSACTION_CONTROL.match(sql))
+
+
+def download_zstd(s3, bucket, key, local_path, reserve=None):
+    '''
+    Stream-decompress a zstd-encoded object into local_path through a .part
+    file and return the decompressed size. reserve(size) runs before anything
+    is written when the frame header records the size, else once it is known.
+    '''
+    if zstandard is None:
+        raise RuntimeError(f'{key} is zstd-compressed but zstandard is not available')
+    part_path = local_path + '.part'
+    try:
+        body = s3.get_object(Bucket=bucket, Key=key)['Body']
+        header = body.read(ZSTD_FRAME_HEADER_MAX_BYTES)
+        content_size = zstandard.frame_content_size(header)
+        if reserve and content_size >= 0:
+            reserve(content_size)
+        decompressor = zstandard.ZstdDecompressor().decompressobj()
+        with open(part_path, 'wb') as f:
+            f.write(decompressor.decompress(header))
+            for chunk in body.iter_chunks(ZSTD_READ_CHUNK_BYTES):
+                f.write(decompressor.decompress(chunk))
+        size = os.path.getsize(part_path)
+        if reserve and content_size < 0:
+            reserve(size)
+        os.replace(part_path, local_path)
+        return size
+    except Exception:
+        if os.path.exists(part_path):
+            os.unlink(part_path)
+        raise
+
+
+def download_db(s3, bucket, key, local_path, content_encoding=None, **kwargs):
+    '''
+    Download a tenant DB to local_path, decoding it if it was stored
+    zstd-compressed. Pass the ContentEncoding from a HeadObject the caller
+    already made ('' for none); otherwise one is made here, only when
+    DB_COMPRESSION is on. kwargs go to download_file.
+    '''
+    if content_encoding is None:
+        if DB_COMPRESSED:
+            content_encoding = s3.head_object(Bucket=bucket, Key=key).get('ContentEncoding', '')
+        else:
+            content_encoding = ''
+    if content_encoding == ZSTD_ENCODING:
+        download_zstd(s3, bucket, key, local_path)
+    else:
+        s3.download_file(bucket, key, local_path, **kwargs)
+
+
+def wait_for_file(path, timeout_seconds):
+    '''
+    Poll for a file written by the async rehydration Lambda. The S3 download
+    lands under a temporary name and is renamed into place, so existence
+    means the file is complete. Backoff is linear (1-100 ms) then doubling
+    up to 1 s; an EFS stat is free, unlike polling S3.
+    '''
+    deadline = time.monotonic() + timeout_seconds
+    attempt = 0
+    while not os.path.exists(path):
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return False
+        attempt += 1
+        if attempt <= 100:
+            delay = 0.001 * attempt
+        else:
+            delay = min(0.1 * 2 ** (attempt - 100), 1.0)
+        time.sleep(min(delay, remaining))
+    return True
+
+
+def invoke_rehydration(lambda_client, function_name, tenant_id, tenant_name, source_bucket, db_key,
+                       target_path, source_type):
+    '''Queue the rehydration Lambda asynchronously; callers poll EFS for the file'''
+    if not function_name:
+        raise RuntimeError('REHYDRATION_FUNCTION_NAME is not set')
+
+    payload = {
+        'tenant_id': tenant_id,
+        'tenant_name': tenant_name,
+        'source_bucket': source_bucket,
+        'db_key': db_key,
+        'target_path': target_path,
+        'source_type': source_type
+    }
+
+    resp = lambda_client.invoke(
+        FunctionName=function_name,
+        InvocationType='Event',
+        Payload=dumps(payload).encode('utf-8')
+    )
+
+    if resp.get('StatusCode') != 202:
+        raise RuntimeError(f'Rehydration Lambda was not queued: StatusCode={resp.get("StatusCode")}')
+
+
+def tenant_tmp_path(tenant_id):
+    '''Fixed /tmp path for a tenant's DB; pass it to remove_tmp_db once done'''
+    return os.path.join(TMP_DB_DIR, f'{tenant_id}.db')
+
+
+def download_tmp_db(s3, bucket, key, local_path, **kwargs):
+    '''
+    Download to a .part file and rename it over local_path, so a failed
+    download never leaves a torn DB behind. Journals left next to an old
+    copy are dropped first; SQLite would otherwise roll them back into the
+    new file.
+    '''
+    part_path = local_path + '.part'
+    try:
+        download_db(s3, bucket, key, part_path, **kwargs)
+        for suffix in ('-journal', '-wal', '-shm'):
+            if os.path.exists(local_path + suffix):
+                os.unlink(local_path + suffix)
+        os.replace(part_path, local_path)
+    except Exception:
+        if os.path.exists(part_path):
+            os.unlink(part_path)
+        raise
+
+
+def remove_tmp_db(local_path):
+    '''Delete a /tmp DB copy along with any journal SQLite left next to it'''
+    for path in (local_path, local_path + '-journal', local_path + '-wal', local_path + '-shm'):
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+
+
+def copy_s3_object(s3, bucket, source_key, dest_key, size, **kwargs):
+    '''Server-side copy within a bucket; kwargs (Config, ExtraArgs) go to the managed copy'''
+    copy_source = {'Bucket': bucket, 'Key': source_key}
+    if size < COPY_OBJECT_MAX_BYTES:
+        s3.copy_object(Bucket=bucket, Key=dest_key, CopySource=copy_source)
+    else:
+        # The managed copy switches to UploadPartCopy
+        s3.copy(copy_source, bucket, dest_key, **kwargs)
+
+
+def _get_redis_client():
+    global _redis_client
+    if _redis_client is not None:
+        return _redis_client
+    if not (REDIS_ENABLED and redis and REDIS_HOST):
+        _redis_client = None
+        return None
+    try:
+        kwargs = dict(
+            host=REDIS_HOST,
+            port=REDIS_PORT,
+            socket_connect_timeout=REDIS_CONNECT_TIMEOUT_MS / 1000.0,
+            socket_timeout=REDIS_SOCKET_TIMEOUT_MS / 1000.0,
+            decode_responses=False,
+        )
+        if REDIS_TLS:
+            kwargs['ssl'] = True
+        if REDIS_AUTH_TOKEN:
+            kwargs['password'] = REDIS_AUTH_TOKEN
+        client = redis.Redis(**kwargs)
+        client.ping()
+        _redis_client = client
+        return client
+    except Exception as e:
+        print(f'WARNING: Redis invalidation disabled/unreachable: {e}')
+        _redis_client = None
+        return None
+
+
+def _tenant_ver_key(tenant_id):
+    return f'octodb:tenant:{tenant_id}:ver'
+
+
+def bump_cache_version(tenant_id):
+    '''Invalidate the tenant's cached reads; a no-op when Redis is off or unreachable'''
+    client = _get_redis_client()
+    if not client or not tenant_id:
+        return
+    try:
+        client.incr(_tenant_ver_key(tenant_id))
+        print(f'Redis cache version bumped for tenant_id={tenant_id}')
+    except Exception as e:
+        print(f'WARNING: Redis cache version bump failed: {e}')
@@ -1,103 +1,333 @@
+import io
+import gzip
 import json
+import logging
 import uuid
 import re
 import datetime as dt
 import os
+import time
 import boto3
 import sqlite3
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
+from concurrent.futures import ThreadPoolExecutor
 from typing import Any, Dict, List, Optional
+from octodb_shared import dumps
 
+try:
+    import apsw  # provided via Lambda Layer
+except Exception:
+    apsw = None
+
+
+# Structured logs, WARNING and above unless LOG_LEVEL says otherwise
+logger = logging.getLogger()
+logger.setLevel(os.environ.get("LOG_LEVEL", "WARNING"))
+
+
+def log_event(level: int, event: str, **fields):
+    # Checked first so disabled levels skip building the JSON entirely
+    if logger.isEnabledFor(level):
+        logger.log(level, json.dumps({"event": event, **fields}, default=str))
+
+
+# Shared by all clients: a pool large enough for the thread pool's parallel calls,
+# kept-alive connections, and the region taken from the Lambda environment
+CLIENT_CONFIG = Config(
+    region_name=os.environ.get("AWS_REGION"),
+    max_pool_connections=64,
+    tcp_keepalive=True,
+    retries={"max_attempts": 5, "mode": "adaptive"}
+)
 
 # Connect to s3
-s3 = boto3.client("s3")
+s3 = boto3.client("s3", config=CLIENT_CONFIG)
 
 # Connect to DynamoDB
-dynamodb = boto3.client("dynamodb")
+dynamodb = boto3.client("dynamodb", config=CLIENT_CONFIG)
 TENANT_TABLE_NAME = os.environ["TENANT_TABLE_NAME"]
 SCHEMA_TABLE_NAME = os.environ["SCHEMA_TABLE_NAME"]
 
 
 # Connect to SQS
-sqs = boto3.client("sqs")
+sqs = boto3.client("sqs", config=CLIENT_CONFIG)
 QUEUE_URL = os.environ["MIGRATION_QUEUE_URL"]
+SQS_BATCH_SIZE = 10  # send_message_batch limit
+SQS_MAX_ATTEMPTS = 4
+RETRY_BASE_DELAY = 0.1  # seconds; doubled on each retry
+DDB_BATCH_GET_SIZE = 100  # batch_get_item limit
+DDB_MAX_ATTEMPTS = 5
+
+# Short-lived lookup caches reused across warm invocations, oldest first. Only
+# fields that never change are cached; api_key and parent_schema_ref are read
+# on every request.
+LOOKUP_CACHE_TTL_SECONDS = float(os.environ.get("LOOKUP_CACHE_TTL_SECONDS", "60"))
+LOOKUP_CACHE_SIZE = 1024
+_tenant_cache: Dict[str, tuple] = {}  # tenant_name -> (expires_at, (tenant_id, current_db_path))
+_schema_cache: Dict[str, tuple] = {}  # schema_name -> (expires_at, (schema_id, s3_path))
+
+# Shared across warm invocations; boto3 clients are safe to call from several threads
+_executor = ThreadPoolExecutor(max_workers=int(os.environ.get("MIGRATION_MAX_WORKERS", "16")))
+
+# Large schema objects are fetched as concurrent byte ranges and uploaded in parts
+SCHEMA_TRANSFER_CONFIG = TransferConfig(
+    multipart_threshold=8 * 1024 * 1024,
+    multipart_chunksize=8 * 1024 * 1024,
+    max_concurrency=10
+)
+GZIP_MAGIC = b"\x1f\x8b"
+
+# Cross-bucket copies switch to parallel UploadPartCopy above the threshold
+COPY_TRANSFER_CONFIG = TransferConfig(
+    multipart_threshold=8 * 1024 * 1024,
+    multipart_chunksize=16 * 1024 * 1024,
+    max_concurrency=10
+)
+
+# Loaded schema databases (sqlite3 serialize() bytes) keyed by the S3 ETag of their SQL
+SCHEMA_DB_CACHE_SIZE = int(os.environ.get("SCHEMA_DB_CACHE_SIZE", "32"))
+_schema_db_cache: Dict[str, bytes] = {}
 
 SAFE_IDENT = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
 
 
+# Validated, quoted identifiers; table/column names repeat across ops and invocations
+QIDENT_CACHE_SIZE = 4096
+_qident_cache: Dict[str, str] = {}
+
+
 def qident(name: str) -> str:
+    # Non-strings (e.g. a list from a malformed op) are unsafe too, not a TypeError
+    if not isinstance(name, str):
+        raise ValueError(f"Unsafe identifier: {name}")
+    quoted = _qident_cache.get(name)
+    if quoted is not None:
+        return quoted
     if not SAFE_IDENT.match(name):
         raise ValueError(f"Unsafe identifier: {name}")
-    return f'"{name}"'
+    quoted = f'"{name}"'
+    if len(_qident_cache) < QIDENT_CACHE_SIZE:
+        _qident_cache[name] = quoted
+    return quoted
+
+
+def run_script(conn: sqlite3.Connection, sql: str):
+    """executescript() with the trailing ';' added if missing; strips the text once."""
+    script = sql.strip()
+    if script:
+        conn.executescript(script if script.endswith(";") else script + ";")
 
 
-def table_exists(conn: sqlite3.Connection, table: str) -> bool:
+def load_schema_catalog(conn: sqlite3.Connection) -> Dict[str, set]:
+    """Map every table to its column names with a single introspection query."""
+    catalog: Dict[str, set] = {}
     cur = conn.execute(
-        "SELECT 1 FROM sqlite_master WHERE type='table' AND name=? LIMIT 1",
-        (table,)
+        "SELECT m.name, p.name FROM sqlite_master AS m "
+        "LEFT JOIN pragma_table_info(m.name) AS p WHERE m.type = 'table'"
     )
-    return cur.fetchone() is not None
+    for table, column in cur:
+        columns = catalog.setdefault(table, set())
+        if column is not None:
+            columns.add(column)
+    return catalog
 
 
-def column_exists(conn: sqlite3.Connection, table: str, column: str) -> bool:
-    cur = conn.execute(f"PRAGMA table_info({qident(table)})")
-    return any(row[1] == column for row in cur.fetchall())  # row[1]=name
+def table_exists(catalog: Dict[str, set], table: str) -> bool:
+    return table in catalog
 
 
-def sql_literal(v: Any) -> str:
-    if v is None:
-        return "NULL"
-    if isinstance(v, (int, float)):
+def column_exists(catalog: Dict[str, set], table: str, column: str) -> bool:
+    return column in catalog.get(table, ())
+
+
+def default_literal(conn: sqlite3.Connection, v: Any) -> str:
+    """
+    SQL literal for an ADD COLUMN DEFAULT. DDL can't take bound parameters,
+    so numbers are inlined and everything else is bound to SQLite's quote().
+    """
+    if isinstance(v, (int, float)) and not isinstance(v, bool):
         return str(v)
-    # string
-    return "'" + str(v).replace("'", "''") + "'"
+    return conn.execute("SELECT quote(?)", (v,)).fetchone()[0]
 
 
 def print_schema_debug(new_sql: str, max_lines: int = 100):
     lines = new_sql.splitlines()
-    print("========== UPDATED SCHEMA SQL (BEGIN) ==========")
-    for line in lines[:max_lines]:
-        print(line)
-    if len(lines) > max_lines:
-        print(f"... ({len(lines) - max_lines} more lines)")
-    print("=========== UPDATED SCHEMA SQL (END) ===========")
+    log_event(
+        logging.DEBUG, "updated_schema_sql",
+        sql="\n".join(lines[:max_lines]),
+        truncated_lines=max(len(lines) - max_lines, 0)
+    )
 
 
-def apply_ops_to_schema_sql(bucket, schema_s3_key, operations):
-    obj = s3.get_object(Bucket=bucket, Key=schema_s3_key)
-    old_sql = obj["Body"].read().decode("utf-8")
+def copy_s3_object(copy_source: Dict[str, str], bucket: str, key: str):
+    if copy_source["Bucket"] == bucket:
+        # Same-bucket rename: always a single server-side CopyObject
+        s3.copy_object(Bucket=bucket, CopySource=copy_source, Key=key)
+    else:
+        # Managed copy: CopyObject for small objects, concurrent UploadPartCopy
+        # for large ones (and past the 5 GB CopyObject limit)
+        s3.copy(copy_source, bucket, key, Config=COPY_TRANSFER_CONFIG)
+
+
+def read_schema_sql(bucket: str, key: str) -> str:
+    buf = io.BytesIO()
+    s3.download_fileobj(bucket, key, buf, Config=SCHEMA_TRANSFER_CONFIG)
+    body = buf.getvalue()
+    # Schemas written by write_schema_sql are gzip-compressed; older ones are plain text
+    if body[:2] == GZIP_MAGIC:
+        body = gzip.decompress(body)
+    return body.decode("utf-8")
+
+
+def write_schema_sql(bucket: str, key: str, sql: str) -> Optional[str]:
+    """Upload the schema; returns the new ETag when a single PUT was used."""
+    body = gzip.compress(sql.encode("utf-8"), compresslevel=1)
+    if len(body) < SCHEMA_TRANSFER_CONFIG.multipart_threshold:
+        resp = s3.put_object(
+            Bucket=bucket, Key=key, Body=body,
+            ContentType="application/sql", ContentEncoding="gzip"
+        )
+        return resp["ETag"]
+    s3.upload_fileobj(
+        io.BytesIO(body), bucket, key,
+        ExtraArgs={"ContentType": "application/sql", "ContentEncoding": "gzip"},
+        Config=SCHEMA_TRANSFER_CONFIG
+    )
+    return None
+
+
+def load_schema_db(bucket: str, key: str) -> sqlite3.Connection:
+    """
+    In-memory database holding the schema at bucket/key. The loaded database
+    is cached by ETag, so an unchanged schema is restored with deserialize()
+    instead of being downloaded and re-run through executescript.
+    """
     conn = sqlite3.connect(":memory:")
+    tune_schema_connection(conn)
+    etag = None
+    if hasattr(conn, "deserialize"):  # Python 3.11+
+        etag = s3.head_object(Bucket=bucket, Key=key)["ETag"]
+        cached = _schema_db_cache.get(etag)
+        if cached is not None:
+            conn.deserialize(cached)
+            # deserialize() swaps in a new pager, so reapply the cache settings
+            tune_schema_connection(conn)
+            return conn
+
+    old_sql = read_schema_sql(bucket, key)
+    if apsw and old_sql.strip() and hasattr(conn, "deserialize"):
+        conn.deserialize(load_schema_with_apsw(old_sql))
+        tune_schema_connection(conn)
+    else:
+        run_script(conn, old_sql)
+    if etag:
+        cache_schema_db(etag, conn)
+    return conn
+
+
+def load_schema_with_apsw(sql: str) -> bytes:
+    """
+    Run the schema script through apsw, which prepares statements with less
+    per-statement overhead than sqlite3.executescript, and return the
+    serialized database for the stdlib connection to deserialize().
+    """
+    db = apsw.Connection(":memory:")
     try:
-        old_sql = (old_sql or "").strip()
-        if old_sql:
-            conn.executescript(old_sql + ("" if old_sql.endswith(";") else ";"))
+        cursor = db.cursor()
+        cursor.execute("PRAGMA page_size = 65536")
+        cursor.execute(sql)  # apsw runs every statement in a multi-statement string
+        return db.serialize("main")
+    finally:
+        db.close()
+
+
+def tune_schema_connection(conn: sqlite3.Connection):
+    # Large pages and a 64 MiB cache keep bulk DDL of big schemas out of eviction;
+    # durability settings are moot for an in-memory database, so turn them off.
+    conn.execute("PRAGMA page_size = 65536")
+    conn.execute("PRAGMA cache_size = -65536")
+    conn.execute("PRAGMA journal_mode = MEMORY")
+    conn.execute("PRAGMA synchronous = OFF")
+    conn.execute("PRAGMA temp_store = MEMORY")
+    conn.execute("PRAGMA locking_mode = EXCLUSIVE")
+
+
+def cache_schema_db(etag: str, conn: sqlite3.Connection):
+    if not hasattr(conn, "serialize"):
+        return
+    while len(_schema_db_cache) >= SCHEMA_DB_CACHE_SIZE:
+        _schema_db_cache.pop(next(iter(_schema_db_cache)))
+    _schema_db_cache[etag] = conn.serialize()
+
+
+def dump_schema_sql(conn: sqlite3.Connection) -> str:
+    """
+    Same layout as "\n".join(conn.iterdump()) for a DDL-only database, read
+    straight from sqlite_master instead of walking every table for rows.
+    Tables come first, then indexes/triggers/views in creation order.
+    """
+    rows = conn.execute(
+        "SELECT type, name, sql FROM sqlite_master "
+        # Case-sensitive prefix test: LIKE would ignore case and treat _ as a wildcard
+        "WHERE sql IS NOT NULL AND substr(name, 1, 7) <> 'sqlite_' "
+        "ORDER BY type <> 'table', rowid"
+    ).fetchall()
+
+    # Templates may carry seed rows; only iterdump reproduces those
+    for typ, name, _ in rows:
+        quoted = '"' + name.replace('"', '""') + '"'  # names come from sqlite_master, not user input
+        if typ == "table" and conn.execute(f"SELECT 1 FROM {quoted} LIMIT 1").fetchone():
+            return "\n".join(conn.iterdump()) + "\n"
+
+    statements = ["BEGIN TRANSACTION;"]
+    statements.extend(f"{sql};" for _, _, sql in rows)
+    statements.append("COMMIT;")
+    return "\n".join(statements) + "\n"
+
 
+def apply_ops_to_schema_sql(bucket, schema_s3_key, operations):
+    if not operations:
+        return
+
+    conn = load_schema_db(bucket, schema_s3_key)
+    try:
+        catalog = load_schema_catalog(conn)
+        changed = False  # stays False when every op turns out to be redundant
         conn.execute("BEGIN;")
         try:
             for op in operations:
                 typ = op["op"]
-                print(f"Operation: {typ}")
+                log_event(logging.DEBUG, "schema_op", op=typ)
                 if typ == "CREATE_TABLE":
                     sql = op.get("sql")
                     if not sql:
                         raise ValueError("CREATE_TABLE requires op['sql']")
                     # For redundancy: if you also include op['table'], you can skip when exists.
-                    conn.executescript(sql.strip() + ("" if sql.strip().endswith(";") else ";"))
+                    run_script(conn, sql)
+                    changed = True
+                    # Arbitrary DDL: the created table names aren't known, so re-read
+                    catalog = load_schema_catalog(conn)
 
                 elif typ == "DROP_TABLE":
                     table = op["table"]
                     conn.execute(f"DROP TABLE IF EXISTS {qident(table)};")
+                    if catalog.pop(table, None) is not None:
+                        changed = True
 
                 elif typ == "RENAME_TABLE":
                     old_name = op["table"]
                     new_name = op.get("new_name") or op.get("name")
                     if not new_name:
                         raise ValueError("RENAME_TABLE requires 'new_name'")
-                    if not table_exists(conn, old_name):
+                    if not table_exists(catalog, old_name):
                         raise ValueError(f"RENAME_TABLE: table does not exist: {old_name}")
-                    if table_exists(conn, new_name):
+                    if table_exists(catalog, new_name):
                         # already renamed or conflict → for your project, treat as redundant
                         continue
                     conn.execute(f"ALTER TABLE {qident(old_name)} RENAME TO {qident(new_name)};")
+                    catalog[new_name] = catalog.pop(old_name)
+                    changed = True
 
                 elif typ == "ADD_COLUMN":
                     table = op["table"]
@@ -107,9 +337,9 @@ def apply_ops_to_schema_sql(bucket, schema_s3_key, operations):
                     nullable = bool(col.get("nullable", True))
                     default = col.get("default", None)
 
-                    if not table_exists(conn, table):
+                    if not table_exists(catalog, table):
                         raise ValueError(f"ADD_COLUMN: table does not exist: {table}")
-                    if column_exists(conn, table, col_name):
+                    if column_exists(catalog, table, col_name):
                         continue  # redundant
 
                     sql = f"ALTER TABLE {qident(table)} ADD COLUMN {qident(col_name)} {col_type}".rstrip()
@@ -119,8 +349,10 @@ def apply_ops_to_schema_sql(bucket, schema_s3_key, operations):
                             raise ValueError("ADD_COLUMN nullable=false requires default in SQLite")
                         sql += " NOT NULL"
                     if default is not None:
-                        sql += f" DEFAULT {sql_literal(default)}"
+                        sql += f" DEFAULT {default_literal(conn, default)}"
                     conn.execute(sql + ";")
+                    catalog[table].add(col_name)
+                    changed = True
 
                 else:
                     raise ValueError(f"Unsupported op: {typ}")
@@ -132,20 +364,27 @@ def apply_ops_to_schema_sql(bucket, schema_s3_key, operations):
             conn.rollback()
             raise
 
+        if not changed:
+            # Replayed/idempotent migration: the stored schema is already current
+            return
+
         # Dump updated schema.
-        new_sql = "\n".join(conn.iterdump()) + "\n"
+        new_sql = dump_schema_sql(conn)
 
-        # Push new schema to s3
-        s3.put_object(Bucket=bucket, Key=schema_s3_key, Body=new_sql.encode("utf-8"))
+        # Push new schema to s3, keeping the updated database cached under its new ETag
+        new_etag = write_schema_sql(bucket, schema_s3_key, new_sql)
+        if new_etag:
+            cache_schema_db(new_etag, conn)
 
         # Debug
-        # print_schema_debug(new_sql)
+        if logger.isEnabledFor(logging.DEBUG):
+            print_schema_debug(new_sql)
 
     finally:
         conn.close()
 
 
-def send_tenant_migration_job_to_sqs(
+def build_tenant_migration_entry(
     id,
     bucket,
     schema_s3_key,
@@ -181,16 +420,171 @@ def send_tenant_migration_job_to_sqs(
 
     dedup_id = f"{id}:{migration_id}"
 
-    resp = sqs.send_message(
-        QueueUrl=QUEUE_URL,
-        MessageBody=json.dumps(message_body),
-        MessageGroupId=str(id),
-        MessageDeduplicationId=dedup_id,
-        MessageAttributes=msg_attrs
+    # "Id" is assigned per batch in send_migration_entries
+    return {
+        "MessageBody": dumps(message_body),
+        "MessageGroupId": str(id),
+        "MessageDeduplicationId": dedup_id,
+        "MessageAttributes": msg_attrs
+    }
+
+
+def send_migration_entries(entries: List[Dict[str, Any]]) -> List[Dict[str, str]]:
+    """
+    Send migration jobs with send_message_batch, 10 per call, with the calls
+    running concurrently. Entries that fail with a server-side error are
+    retried with exponential backoff.
+    """
+    batches = [entries[i:i + SQS_BATCH_SIZE] for i in range(0, len(entries), SQS_BATCH_SIZE)]
+    return [sent for batch in _executor.map(_send_migration_batch, batches) for sent in batch]
+
+
+def _send_migration_batch(batch: List[Dict[str, Any]]) -> List[Dict[str, str]]:
+    sent = []
+    pending = {str(i): entry for i, entry in enumerate(batch)}
+
+    for attempt in range(SQS_MAX_ATTEMPTS):
+        resp = sqs.send_message_batch(
+            QueueUrl=QUEUE_URL,
+            Entries=[{"Id": entry_id, **entry} for entry_id, entry in pending.items()]
+        )
+
+        for ok in resp.get("Successful", []):
+            entry = pending.pop(ok["Id"])
+            migration_id = entry["MessageAttributes"]["migrationId"]["StringValue"]
+            sent.append({"migrationId": migration_id, "sqsMessageId": ok["MessageId"]})
+
+        failed = resp.get("Failed", [])
+        if not failed:
+            break
+
+        log_event(logging.WARNING, "send_message_batch_failures", attempt=attempt + 1, failed=failed)
+        if any(f.get("SenderFault") for f in failed) or attempt == SQS_MAX_ATTEMPTS - 1:
+            raise RuntimeError(f"Failed to enqueue migration jobs: {failed}")
+        time.sleep(RETRY_BASE_DELAY * (2 ** attempt))
+
+    return sent
+
+
+def batch_get_tenants(tenant_ids: List[str], projection: str) -> Dict[str, Dict[str, Any]]:
+    """
+    Fetch tenant items with batch_get_item (100 keys per call, calls run
+    concurrently), retrying UnprocessedKeys with exponential backoff.
+    Returns the raw items keyed by tenant_id.
+    """
+    chunks = [tenant_ids[i:i + DDB_BATCH_GET_SIZE] for i in range(0, len(tenant_ids), DDB_BATCH_GET_SIZE)]
+    items = {}
+    for chunk_items in _executor.map(lambda chunk: _batch_get_tenant_chunk(chunk, projection), chunks):
+        for item in chunk_items:
+            items[item["tenant_id"]["S"]] = item
+    return items
+
+
+def _batch_get_tenant_chunk(tenant_ids: List[str], projection: str) -> List[Dict[str, Any]]:
+    items = []
+    request = {
+        TENANT_TABLE_NAME: {
+            "Keys": [{"tenant_id": {"S": tid}} for tid in tenant_ids],
+            "ProjectionExpression": projection
+        }
+    }
+
+    for attempt in range(DDB_MAX_ATTEMPTS):
+        resp = dynamodb.batch_get_item(RequestItems=request)
+        items.extend(resp.get("Responses", {}).get(TENANT_TABLE_NAME, []))
+
+        request = resp.get("UnprocessedKeys") or {}
+        if not request:
+            return items
+        time.sleep(RETRY_BASE_DELAY * (2 ** attempt))
+
+    raise RuntimeError(f"Unprocessed tenant keys after {DDB_MAX_ATTEMPTS} attempts: {request}")
+
+
+def _cache_get(cache: Dict[str, tuple], key: str):
+    entry = cache.get(key)
+    if entry and entry[0] > time.monotonic():
+        return entry[1]
+    cache.pop(key, None)
+    return None
+
+
+def _cache_put(cache: Dict[str, tuple], key: str, value):
+    cache.pop(key, None)
+    while len(cache) >= LOOKUP_CACHE_SIZE:
+        cache.pop(next(iter(cache)))
+    cache[key] = (time.monotonic() + LOOKUP_CACHE_TTL_SECONDS, value)
+
+
+def get_tenant_record(tenant_name: str) -> Optional[tuple]:
+    """Return (tenant_id, current_db_path) for a tenant name, or None if unknown."""
+    record = _cache_get(_tenant_cache, tenant_name)
+    if record is not None:
+        return record
+
+    response_tenant = dynamodb.query(
+        TableName=TENANT_TABLE_NAME,
+        IndexName="Tenant_Name_Index",
+        KeyConditionExpression="tenant_name = :tname",
+        ExpressionAttributeValues={
+            ":tname": {"S": tenant_name}
+        },
+        ProjectionExpression="tenant_id, current_db_path"
+    )
+    if not response_tenant["Items"]:
+        return None
+
+    item = response_tenant["Items"][0]
+    record = (item["tenant_id"]["S"], item["current_db_path"]["S"])
+    _cache_put(_tenant_cache, tenant_name, record)
+    return record
+
+
+def get_tenant_auth_fields(tenant_id: str) -> Optional[Dict[str, Any]]:
+    """
+    Current api_key and parent_schema_ref of a tenant. Read consistently on
+    every request: a rotated key or a migration run by another container
+    must take effect at once.
+    """
+    response_tenant = dynamodb.get_item(
+        TableName=TENANT_TABLE_NAME,
+        Key={"tenant_id": {"S": tenant_id}},
+        ProjectionExpression="api_key, parent_schema_ref",
+        ConsistentRead=True
     )
-    print(resp)
+    return response_tenant.get("Item")
 
-    return {"migrationId": migration_id, "sqsMessageId": resp["MessageId"]}
+
+def get_schema_record(schema_name: str) -> Optional[tuple]:
+    """Return (schema_id, s3_path) for a schema name, or None if unknown."""
+    record = _cache_get(_schema_cache, schema_name)
+    if record is not None:
+        return record
+
+    response_schema = dynamodb.query(
+        TableName=SCHEMA_TABLE_NAME,
+        IndexName="schema_name_index",
+        KeyConditionExpression="schema_name = :sid",
+        ExpressionAttributeValues={
+            ":sid": {"S": schema_name}
+        },
+        ProjectionExpression="schema_id"
+    )
+    if not response_schema["Items"]:
+        return None
+
+    schema_id = response_schema["Items"][0]["schema_id"]["S"]
+    response_schema = dynamodb.get_item(
+        TableName=SCHEMA_TABLE_NAME,
+        Key={"schema_id": {"S": schema_id}},
+        ProjectionExpression="s3_path"
+    )
+    if "Item" not in response_schema:
+        return None
+
+    record = (schema_id, response_schema["Item"]["s3_path"]["S"])
+    _cache_put(_schema_cache, schema_name, record)
+    return record
 
 
 def lambda_handler(event, context):
@@ -201,22 +595,15 @@ def lambda_handler(event, context):
     if (scope == "TENANT"):
         tenantName = event["tenantName"]
 
-        response_tenant = dynamodb.query(
-            TableName=TENANT_TABLE_NAME,
-            IndexName="Tenant_Name_Index",
-            KeyConditionExpression="tenant_name = :tname",
-            ExpressionAttributeValues={
-                ":tname": {"S": tenantName}
-            }
-        )
-
-        tenant_id = response_tenant["Items"][0]["tenant_id"]["S"]
-
-        response = dynamodb.get_item(TableName=TENANT_TABLE_NAME, Key={"tenant_id": {"S": tenant_id}})
+        tenant_record = get_tenant_record(tenantName)
+        tenant_item = get_tenant_auth_fields(tenant_record[0]) if tenant_record else None
+        if tenant_record and tenant_item is None:
+            # Tenant removed since its id was cached
+            _tenant_cache.pop(tenantName, None)
 
         # Validate request
         try:
-            if (event["apiKey"] != response["Item"]["api_key"]["S"]):
+            if (event["apiKey"] != tenant_item["api_key"]["S"]):
                 return {
                     "statusCode": 401,
                     "body": json.dumps({
@@ -231,9 +618,9 @@ def lambda_handler(event, context):
                 }),
             }
 
-        tenant_s3_path = response["Item"]["current_db_path"]['S']
+        tenant_id, tenant_s3_path = tenant_record
 
-        parent_schema = response["Item"]["parent_schema_ref"]['S']
+        parent_schema = tenant_item["parent_schema_ref"]['S']
 
         # Copy the schema and rename the new schema
         bucket = "octodb-tenants-bucket"
@@ -247,57 +634,59 @@ def lambda_handler(event, context):
             "Bucket": bucket,
             "Key": source_key
         }
-        print(copy_source)  # TODO: Redoing the migration again messes it up
-        print(dest_key)
+        # TODO: Redoing the migration again messes it up
+        log_event(logging.DEBUG, "schema_copy", source=copy_source, dest_key=dest_key)
 
         if (parent_schema != "NULL"):
-            s3.copy_object(Bucket=bucket, CopySource=copy_source, Key=dest_key)
+            copy_s3_object(copy_source, bucket, dest_key)
 
         # Apply migration to the copied schema
         apply_ops_to_schema_sql(bucket, dest_key, operations)
 
-        # Copy the schema to standby replica bucket
+        # The standby copy, the job fan-out and the metadata writes below are
+        # independent of each other, so they run concurrently
         standby_copy_source = {
             "Bucket": bucket,
             "Key": dest_key
         }
-        s3.copy_object(Bucket=standby_replica_bucket, CopySource=standby_copy_source, Key=dest_key)
-
-        # Send tenant to migration SQS job
-        out = send_tenant_migration_job_to_sqs(
-            id=tenant_id,
-            bucket=bucket,
-            schema_s3_key=dest_key,
-            tenant_s3_key=tenant_s3_path,
-            operations=operations,
-            tenant_id=tenant_id,           # ADD THIS
-            tenant_name=tenantName         # optional
-        )
-
-        # Send read-only replica to migration SQS job
-        out_read_only_replica = send_tenant_migration_job_to_sqs(
-            id=f"{tenant_id}-read-only-replica",
-            bucket=read_only_replica_bucket,
-            schema_s3_key=dest_key,
-            tenant_s3_key=tenant_s3_path,
-            operations=operations,
-            tenant_id=tenant_id,           # ADD THIS
-            tenant_name=tenantName         # optional
-        )
-
-        # Send standby replica to migration SQS job
-        out_standby_replica = send_tenant_migration_job_to_sqs(
-            id=f"{tenant_id}-standby-replica",
-            bucket=standby_replica_bucket,
-            schema_s3_key=dest_key,
-            tenant_s3_key=tenant_s3_path,
-            operations=operations,
-            tenant_id=tenant_id,           # ADD THIS
-            tenant_name=tenantName         # optional
-        )
+        futures = [
+            _executor.submit(copy_s3_object, standby_copy_source, standby_replica_bucket, dest_key)
+        ]
+
+        # Send tenant, read-only replica and standby replica jobs in one batch
+        send_migration_entries([
+            build_tenant_migration_entry(
+                id=tenant_id,
+                bucket=bucket,
+                schema_s3_key=dest_key,
+                tenant_s3_key=tenant_s3_path,
+                operations=operations,
+                tenant_id=tenant_id,           # ADD THIS
+                tenant_name=tenantName         # optional
+            ),
+            build_tenant_migration_entry(
+                id=f"{tenant_id}-read-only-replica",
+                bucket=read_only_replica_bucket,
+                schema_s3_key=dest_key,
+                tenant_s3_key=tenant_s3_path,
+                operations=operations,
+                tenant_id=tenant_id,           # ADD THIS
+                tenant_name=tenantName         # optional
+            ),
+            build_tenant_migration_entry(
+                id=f"{tenant_id}-standby-replica",
+                bucket=standby_replica_bucket,
+                schema_s3_key=dest_key,
+                tenant_s3_key=tenant_s3_path,
+                operations=operations,
+                tenant_id=tenant_id,           # ADD THIS
+                tenant_name=tenantName         # optional
+            )
+        ])
 
         # Add new schema to Dynamo
-        dynamodb.put_item(
+        futures.append(_executor.submit(
+            dynamodb.put_item,
             TableName=SCHEMA_TABLE_NAME,
             Item={
                 "schema_id": {"S": tenant_id},
@@ -308,30 +697,25 @@ def lambda_handler(event, context):
                 "schema_type": {"S": "TEMPLATE"},
                 "tenant_id": {"S": tenant_id}
             }
-        )
+        ))
 
         # Update the parent_schema_ref
-        dynamodb.update_item(
+        futures.append(_executor.submit(
+            dynamodb.update_item,
             TableName=TENANT_TABLE_NAME,
             Key={"tenant_id": {"S": tenant_id}},
             UpdateExpression="SET parent_schema_ref = :s",
             ExpressionAttributeValues={":s": {"S": "NULL"}}
-        )
+        ))
+
+        # Surface any failure from the concurrent calls
+        for future in futures:
+            future.result()
 
     elif (scope == "TEMPLATE"):
 
         schemaName = event["schemaName"]
-        response_schema = dynamodb.query(
-            TableName=SCHEMA_TABLE_NAME,
-            IndexName="schema_name_index",
-            KeyConditionExpression="schema_name = :sid",
-            ExpressionAttributeValues={
-                ":sid": {"S": schemaName}
-            }
-        )
-
-        schema_id = response_schema["Items"][0]["schema_id"]["S"]
-        response_schema = dynamodb.get_item(TableName=SCHEMA_TABLE_NAME, Key={"schema_id": {"S": schema_id}})
+        schema_record = get_schema_record(schemaName)
 
         # #Validate request
         # try:
@@ -344,7 +728,7 @@ def lambda_handler(event, context):
         #         }
 
         try:
-            schema_s3_path = response_schema["Item"]["s3_path"]['S']
+            schema_id, schema_s3_path = schema_record
         except:
             return {
                 "statusCode": 400,
@@ -360,7 +744,8 @@ def lambda_handler(event, context):
             KeyConditionExpression="parent_schema_ref = :sid",
             ExpressionAttributeValues={
                 ":sid": {"S": schema_id}
-            }
+            },
+            ProjectionExpression="tenant_id"
         )
 
         tenant_ids_with_given_schema = [item["tenant_id"]["S"] for item in response_tenants["Items"]]
@@ -370,48 +755,55 @@ def lambda_handler(event, context):
         read_only_replica_bucket = "scalable-db-read-only-replica-bucket"
         standby_replica_bucket = "octodb-tenants-standby-bucket"
 
-        apply_ops_to_schema_sql(bucket, schema_s3_path, operations)
+        # The tenant lookups don't depend on the schema, so fetch them while it is updated
+        schema_future = _executor.submit(apply_ops_to_schema_sql, bucket, schema_s3_path, operations)
+        tenant_items = batch_get_tenants(tenant_ids_with_given_schema, "tenant_id, current_db_path")
+        schema_future.result()
 
-        # Copy updated schema to standby replica bucket
+        # Copy updated schema to standby replica bucket while the jobs are sent
         standby_copy_source = {
             "Bucket": bucket,
             "Key": schema_s3_path
         }
-        s3.copy_object(Bucket=standby_replica_bucket, CopySource=standby_copy_source, Key=schema_s3_path)
+        standby_future = _executor.submit(
+            copy_s3_object, standby_copy_source, standby_replica_bucket, schema_s3_path
+        )
 
+        # Collect every tenant's jobs and send them in batches of 10
+        entries = []
         for tenant_id in tenant_ids_with_given_schema:
 
-            response_tenant = dynamodb.get_item(TableName=TENANT_TABLE_NAME, Key={"tenant_id": {"S": tenant_id}})
-            tenant_s3_path = response_tenant["Item"]["current_db_path"]["S"]
+            tenant_s3_path = tenant_items[tenant_id]["current_db_path"]["S"]
 
-            out_tenant = send_tenant_migration_job_to_sqs(
+            entries.append(build_tenant_migration_entry(
                 id=f"{schema_id}:{tenant_id}",
                 bucket=bucket,
                 schema_s3_key=schema_s3_path,
                 tenant_s3_key=tenant_s3_path,
                 operations=operations,
                 tenant_id=tenant_id,
-            )
+            ))
 
-            out_read_only_replica = send_tenant_migration_job_to_sqs(
+            entries.append(build_tenant_migration_entry(
                 id=f"{tenant_id}-read-only-replica",
                 bucket=read_only_replica_bucket,
-                schema_s3_key=dest_key,
+                schema_s3_key=schema_s3_path,
                 tenant_s3_key=tenant_s3_path,
                 operations=operations,
-                tenant_id=tenant_id,           # ADD THIS
-                tenant_name=tenantName,         # optional
-            )
+                tenant_id=tenant_id,
+            ))
 
-            out_standby_replica = send_tenant_migration_job_to_sqs(
+            entries.append(build_tenant_migration_entry(
                 id=f"{tenant_id}-standby-replica",
                 bucket=standby_replica_bucket,
-                schema_s3_key=dest_key,
+                schema_s3_key=schema_s3_path,
                 tenant_s3_key=tenant_s3_path,
                 operations=operations,
-                tenant_id=tenant_id,           # ADD THIS
-                tenant_name=tenantName         # optional
-            )
+                tenant_id=tenant_id,
+            ))
+
+        send_migration_entries(entries)
+        standby_future.result()
 
     return {
         'statusCode': 202,
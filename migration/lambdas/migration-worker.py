@@ -1,12 +1,42 @@
+import hashlib
 import json
 import os
 import re
 import sqlite3
+import threading
 import boto3
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict
+from octodb_shared import bump_cache_version, db_transfer_config, download_db, dumps, loads
 
 s3 = boto3.client("s3")
 lambda_client = boto3.client("lambda")
-dynamodb = boto3.resource("dynamodb")
+dynamodb = boto3.client("dynamodb")
+
+# Tenant DBs can be large: ranged parallel GETs on download, multipart on upload
+TRANSFER_CONFIG = db_transfer_config(max_concurrency=16)
+
+# Overlaps S3 transfers for independent DBs within one SQS batch
+_executor = ThreadPoolExecutor(max_workers=int(os.environ.get("MIGRATION_MAX_WORKERS", "4")))
+
+# Migrated DBs stay in /tmp between invocations; a later migration of the same
+# object skips the download while its S3 ETag is unchanged
+DB_CACHE_DIR = os.environ.get("DB_CACHE_DIR", "/tmp")
+DB_CACHE_MAX_BYTES = int(os.environ.get("DB_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+_etag_cache: Dict[str, tuple] = {}  # local path -> (etag, size), oldest first
+_in_flight: set = set()  # local paths being migrated right now; never evicted
+_db_cache_lock = threading.Lock()
+
+# Set once per connection. The /tmp copy is throwaway (S3 is authoritative),
+# so skip the per-commit fsyncs.
+CONNECTION_PRAGMAS = (
+    "PRAGMA foreign_keys = ON;"
+    "PRAGMA journal_mode = WAL;"
+    "PRAGMA synchronous = NORMAL;"
+    "PRAGMA temp_store = MEMORY;"
+    "PRAGMA cache_size = -65536;"
+    "PRAGMA locking_mode = EXCLUSIVE;"
+)
 
 SAFE_IDENT = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
 TENANTS_TABLE = os.environ.get("TENANTS_TABLE", "octodb-tenants")
@@ -14,95 +44,83 @@ PRIMARY_BUCKET = os.environ.get("PRIMARY_BUCKET", "octodb-tenants-bucket")
 REHYDRATION_FUNCTION = os.environ.get("REHYDRATION_FUNCTION", "rehydration-handler")
 EFS_MOUNT_ROOT = os.environ.get("EFS_MOUNT_ROOT", "/mnt/efs")
 
-# ------------------------
-# Redis (ElastiCache) invalidation
-# ------------------------
-try:
-    import redis  # provided via Lambda Layer
-except Exception:
-    redis = None
-
-REDIS_ENABLED = os.environ.get("REDIS_ENABLED", "false").lower() == "true"
-REDIS_HOST = os.environ.get("REDIS_HOST")
-REDIS_PORT = int(os.environ.get("REDIS_PORT", "6379"))
-REDIS_TLS = os.environ.get("REDIS_TLS", "false").lower() == "true"
-REDIS_AUTH_TOKEN = os.environ.get("REDIS_AUTH_TOKEN")
-REDIS_CONNECT_TIMEOUT_MS = int(os.environ.get("REDIS_CONNECT_TIMEOUT_MS", "50"))
-REDIS_SOCKET_TIMEOUT_MS = int(os.environ.get("REDIS_SOCKET_TIMEOUT_MS", "50"))
-
-_redis_client = None
-
-
-def _get_redis_client():
-    global _redis_client
-    if _redis_client is not None:
-        return _redis_client
-    if not (REDIS_ENABLED and redis and REDIS_HOST):
-        _redis_client = None
-        return None
-    try:
-        kwargs = dict(
-            host=REDIS_HOST,
-            port=REDIS_PORT,
-            socket_connect_timeout=REDIS_CONNECT_TIMEOUT_MS / 1000.0,
-            socket_timeout=REDIS_SOCKET_TIMEOUT_MS / 1000.0,
-            decode_responses=False,
-        )
-        if REDIS_TLS:
-            kwargs["ssl"] = True
-        if REDIS_AUTH_TOKEN:
-            kwargs["password"] = REDIS_AUTH_TOKEN
-        client = redis.Redis(**kwargs)
-        client.ping()
-        _redis_client = client
-        return client
-    except Exception as e:
-        print(f"WARNING: Redis invalidation disabled/unreachable: {e}")
-        _redis_client = None
-        return None
-
-
-def _tenant_ver_key(tenant_id: str) -> str:
-    return f"octodb:tenant:{tenant_id}:ver"
-
-
-def bump_cache_version(tenant_id: str):
-    client = _get_redis_client()
-    if not client or not tenant_id:
-        return
-    try:
-        client.incr(_tenant_ver_key(tenant_id))
-        print(f"Redis cache version bumped for tenant_id={tenant_id}")
-    except Exception as e:
-        print(f"WARNING: Redis cache version bump failed: {e}")
+# Validated, quoted identifiers; table/column names repeat across ops and invocations
+QIDENT_CACHE_SIZE = 4096
+_qident_cache: Dict[str, str] = {}
 
 
 def qident(name: str) -> str:
+    # Non-strings (e.g. a list from a malformed op) are unsafe too, not a TypeError
+    if not isinstance(name, str):
+        raise ValueError(f"Unsafe identifier: {name}")
+    quoted = _qident_cache.get(name)
+    if quoted is not None:
+        return quoted
     if not SAFE_IDENT.match(name):
         raise ValueError(f"Unsafe identifier: {name}")
-    return f'"{name}"'
+    quoted = f'"{name}"'
+    if len(_qident_cache) < QIDENT_CACHE_SIZE:
+        _qident_cache[name] = quoted
+    return quoted
 
 
-def table_exists(conn: sqlite3.Connection, table: str) -> bool:
+def load_schema_catalog(conn: sqlite3.Connection) -> Dict[str, set]:
+    """Map every table to its column names with a single introspection query."""
+    catalog: Dict[str, set] = {}
     cur = conn.execute(
-        "SELECT 1 FROM sqlite_master WHERE type='table' AND name=? LIMIT 1",
-        (table,)
+        "SELECT m.name, p.name FROM sqlite_master AS m "
+        "LEFT JOIN pragma_table_info(m.name) AS p WHERE m.type = 'table'"
     )
-    return cur.fetchone() is not None
-
-
-def column_exists(conn: sqlite3.Connection, table: str, column: str) -> bool:
-    cur = conn.execute(f"PRAGMA table_info({qident(table)})")
-    return any(row[1] == column for row in cur.fetchall())  # row[1]=name
-
-
-def sql_literal(v: Any) -> str:
-    if v is None:
-        return "NULL"
-    if isinstance(v, (int, float)):
+    for table, column in cur:
+        columns = catalog.setdefault(table, set())
+        if column is not None:
+            columns.add(column)
+    return catalog
+
+
+def table_exists(catalog: Dict[str, set], table: str) -> bool:
+    return table in catalog
+
+
+def column_exists(catalog: Dict[str, set], table: str, column: str) -> bool:
+    return column in catalog.get(table, ())
+
+
+def split_statements(sql: str):
+    """
+    Split a script on ';' into complete statements. sqlite3.complete_statement
+    keeps quoted ';' and trigger bodies (BEGIN ... END) in one piece.
+    """
+    statements = []
+    pending = ""
+    for part in sql.split(";"):
+        pending += part + ";"
+        if sqlite3.complete_statement(pending):
+            if pending.strip(" \t\r\n;"):
+                statements.append(pending.strip())
+            pending = ""
+    if pending.strip(" \t\r\n;"):
+        statements.append(pending.strip())  # incomplete: let execute() report it
+    return statements
+
+
+def run_statements(conn: sqlite3.Connection, sql: str):
+    """
+    Run a DDL script statement by statement. Unlike executescript(), this
+    doesn't COMMIT first, so the ops stay inside the batch's transaction.
+    """
+    for statement in split_statements(sql):
+        conn.execute(statement)
+
+
+def default_literal(conn: sqlite3.Connection, v: Any) -> str:
+    """
+    SQL literal for an ADD COLUMN DEFAULT. DDL can't take bound parameters,
+    so numbers are inlined and everything else is bound to SQLite's quote().
+    """
+    if isinstance(v, (int, float)) and not isinstance(v, bool):
         return str(v)
-    # string
-    return "'" + str(v).replace("'", "''") + "'"
+    return conn.execute("SELECT quote(?)", (v,)).fetchone()[0]
 
 
 def print_schema_debug(new_sql: str, max_lines: int = 100):
@@ -115,13 +133,34 @@ def print_schema_debug(new_sql: str, max_lines: int = 100):
     print("=========== UPDATED SCHEMA SQL (END) ===========")
 
 
+def group_add_columns(operations):
+    """
+    Merge consecutive ADD_COLUMN ops on the same table into one ADD_COLUMNS op
+    so wide migrations are validated and applied as a single run per table.
+    """
+    grouped = []
+    for op in operations:
+        if op["op"] == "ADD_COLUMN":
+            last = grouped[-1] if grouped else None
+            if last and last["op"] == "ADD_COLUMNS" and last["table"] == op["table"]:
+                last["columns"].append(op["column"])
+            else:
+                grouped.append({"op": "ADD_COLUMNS", "table": op["table"], "columns": [op["column"]]})
+        else:
+            grouped.append(op)
+    return grouped
+
+
 def apply_ops_to_tenant_db(conn, operations):
 
     try:
-        conn.execute("PRAGMA foreign_keys = ON;")
+        catalog = load_schema_catalog(conn)
         conn.execute("BEGIN;")
+        # Check FKs once at COMMIT rather than per DDL statement. SQLite clears
+        # this flag at the end of every transaction, so it's set inside the BEGIN.
+        conn.execute("PRAGMA defer_foreign_keys = ON;")
         try:
-            for op in operations:
+            for op in group_add_columns(operations):
                 typ = op["op"]
 
                 if typ == "CREATE_TABLE":
@@ -129,54 +168,68 @@ def apply_ops_to_tenant_db(conn, operations):
                     if not sql:
                         raise ValueError("CREATE_TABLE requires op['sql']")
                     # For redundancy: if you also include op['table'], you can skip when exists.
-                    conn.executescript(sql.strip() + ("" if sql.strip().endswith(";") else ";"))
+                    run_statements(conn, sql)
+                    # Arbitrary DDL: the created table names aren't known, so re-read
+                    catalog = load_schema_catalog(conn)
 
                 elif typ == "DROP_TABLE":
                     table = op["table"]
                     conn.execute(f"DROP TABLE IF EXISTS {qident(table)};")
-                    # conn.execute("COMMIT;")
+                    catalog.pop(table, None)
 
                 elif typ == "RENAME_TABLE":
                     old_name = op["table"]
                     new_name = op.get("new_name") or op.get("name")
                     if not new_name:
                         raise ValueError("RENAME_TABLE requires 'new_name'")
-                    if not table_exists(conn, old_name):
+                    if not table_exists(catalog, old_name):
                         raise ValueError(f"RENAME_TABLE: table does not exist: {old_name}")
-                    if table_exists(conn, new_name):
+                    if table_exists(catalog, new_name):
                         # already renamed or conflict → for your project, treat as redundant
                         continue
                     conn.execute(f"ALTER TABLE {qident(old_name)} RENAME TO {qident(new_name)};")
-                    # conn.execute("COMMIT;")
+                    catalog[new_name] = catalog.pop(old_name)
 
-                elif typ == "ADD_COLUMN":
+                elif typ == "ADD_COLUMNS":
+                    # Run of consecutive ADD_COLUMN ops on one table (see group_add_columns)
                     table = op["table"]
-                    col = op["column"]
-                    col_name = col["name"]
-                    col_type = col.get("type", "")
-                    nullable = bool(col.get("nullable", True))
-                    default = col.get("default", None)
-
-                    if not table_exists(conn, table):
+                    if not table_exists(catalog, table):
                         raise ValueError(f"ADD_COLUMN: table does not exist: {table}")
-                    if column_exists(conn, table, col_name):
-                        continue  # redundant
-
-                    sql = f"ALTER TABLE {qident(table)} ADD COLUMN {qident(col_name)} {col_type}".rstrip()
-                    if nullable is False:
-                        # SQLite: NOT NULL add should have DEFAULT (practical rule)
-                        if default is None:
-                            raise ValueError("ADD_COLUMN nullable=false requires default in SQLite")
-                        sql += " NOT NULL"
-                    if default is not None:
-                        sql += f" DEFAULT {sql_literal(default)}"
-                    conn.execute(sql + ";")
-                    # conn.execute("COMMIT;")
+
+                    # Build and validate every statement before running any of them
+                    statements = []
+                    quoted_table = qident(table)
+                    for col in op["columns"]:
+                        col_name = col["name"]
+                        col_type = col.get("type", "")
+                        nullable = bool(col.get("nullable", True))
+                        default = col.get("default", None)
+
+                        if column_exists(catalog, table, col_name):
+                            continue  # redundant
+
+                        sql = f"ALTER TABLE {quoted_table} ADD COLUMN {qident(col_name)} {col_type}".rstrip()
+                        if nullable is False:
+                            # SQLite: NOT NULL add should have DEFAULT (practical rule)
+                            if default is None:
+                                raise ValueError("ADD_COLUMN nullable=false requires default in SQLite")
+                            sql += " NOT NULL"
+                        if default is not None:
+                            sql += f" DEFAULT {default_literal(conn, default)}"
+                        statements.append(sql + ";")
+                        catalog[table].add(col_name)
+
+                    # Back to back inside the open transaction; executescript() would
+                    # COMMIT it first and break the batch's atomicity. Each ALTER has
+                    # distinct identifier text (DDL can't bind parameters), so there
+                    # is no shared prepared statement for executemany() to reuse.
+                    for sql in statements:
+                        conn.execute(sql)
 
                 else:
                     raise ValueError(f"Unsupported op: {typ}")
-            if (operations[-1]["op"] != "CREATE_TABLE"):
-                conn.commit()
+            # One commit for the whole batch
+            conn.commit()
 
         except Exception:
             conn.rollback()
@@ -192,17 +245,26 @@ def apply_ops_to_tenant_db(conn, operations):
         # print_schema_debug(new_sql)
 
     finally:
+        # Checkpoint and leave WAL mode so the uploaded file is self-contained and
+        # doesn't carry WAL mode into the EFS copy made on rehydration. A failure
+        # here must not mask the error that got us into the finally.
+        try:
+            conn.execute("PRAGMA journal_mode = DELETE;")
+        except Exception as e:
+            print(f"WARNING: failed to reset journal_mode: {e}")
         conn.close()
 
 
 def get_tenant_storage_tier(tenant_id: str) -> str:
-    table = dynamodb.Table(TENANTS_TABLE)
-    resp = table.get_item(Key={"tenant_id": tenant_id})
+    resp = dynamodb.get_item(
+        TableName=TENANTS_TABLE,
+        Key={"tenant_id": {"S": tenant_id}}
+    )
     item = resp.get("Item") or {}
-    return item.get("storage_tier", "COLD")
+    return item.get("storage_tier", {}).get("S", "COLD")
 
 
-def invoke_rehydration(tenant_id: str, tenant_name: str, bucket: str, db_key: str):
+def invoke_rehydration(tenant_id: str, tenant_name: str, bucket: str, db_key: str, migration_id: str = None):
     target_path = f"{EFS_MOUNT_ROOT}/{db_key}"  # keeps same key structure under /mnt/efs
     payload = {
         "tenant_id": tenant_id,
@@ -211,37 +273,104 @@ def invoke_rehydration(tenant_id: str, tenant_name: str, bucket: str, db_key: st
         "db_key": db_key,
         "target_path": target_path,
         "source_type": "primary",
-        "reason": "MIGRATION_CACHE_REFRESH"
+        "reason": "MIGRATION_CACHE_REFRESH",
+        "migration_id": migration_id
     }
 
-    print(f"[cache-refresh] Invoking {REHYDRATION_FUNCTION} with: {json.dumps(payload)}")
+    payload_json = dumps(payload)
+    print(f"[cache-refresh] Invoking {REHYDRATION_FUNCTION} with: {payload_json}")
 
-    resp = lambda_client.invoke(
+    # Fire-and-forget: the migrated DB is already durable in S3, so the worker
+    # doesn't wait on the EFS copy. Failures surface in rehydration's own
+    # logs / DLQ, correlated by migration_id.
+    lambda_client.invoke(
         FunctionName=REHYDRATION_FUNCTION,
-        InvocationType="RequestResponse",
-        Payload=json.dumps(payload).encode("utf-8"),
+        InvocationType="Event",
+        Payload=payload_json.encode("utf-8"),
     )
-    out = json.loads(resp["Payload"].read().decode("utf-8") or "{}")
-    if isinstance(out, dict) and out.get("statusCode", 200) >= 400:
-        raise RuntimeError(f"Rehydration failed: {out}")
-    return out
+
+
+def local_db_path(bucket: str, key: str) -> str:
+    # One stable path per S3 object, so concurrent groups never share a file. Hashed:
+    # flattening '/' to '_' would map keys like "a/b_c" and "a_b/c" to the same file
+    digest = hashlib.sha256(f"{bucket}/{key}".encode("utf-8")).hexdigest()[:32]
+    return os.path.join(DB_CACHE_DIR, f"in_{digest}.sqlite")
+
+
+def upload_etag(path: str) -> str:
+    """
+    ETag S3 assigns to `path` uploaded with TRANSFER_CONFIG: the MD5 for a single
+    PUT, the MD5 of the part MD5s plus '-<parts>' for multipart. Computed locally
+    rather than read back, since a HEAD after upload could see a concurrent
+    writer's object. (With SSE-KMS it never matches, which only costs a download.)
+    """
+    size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        if size < TRANSFER_CONFIG.multipart_threshold:
+            return f'"{hashlib.md5(f.read()).hexdigest()}"'
+        chunk = TRANSFER_CONFIG.multipart_chunksize
+        digests = [hashlib.md5(part).digest() for part in iter(lambda: f.read(chunk), b"")]
+    return f'"{hashlib.md5(b"".join(digests)).hexdigest()}-{len(digests)}"'
+
+
+def cache_migrated_db(local_path: str, etag: str):
+    """Record the uploaded copy, evicting the oldest idle ones past DB_CACHE_MAX_BYTES."""
+    with _db_cache_lock:
+        _etag_cache[local_path] = (etag, os.path.getsize(local_path))
+        total = sum(size for _, size in _etag_cache.values())
+        for path in list(_etag_cache):
+            if total <= DB_CACHE_MAX_BYTES:
+                break
+            if path in _in_flight:
+                continue
+            total -= _etag_cache.pop(path)[1]
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
 
 
 def handler_one_message(migration_id, bucket, schema_key, tenant_key, operations, tenant_id=None):
 
     # Use /tmp (Lambda writable space)
-    local_in = f"/tmp/in_{migration_id}.sqlite"
-
-    # Download DB
-    s3.download_file(bucket, tenant_key, local_in)
+    local_in = local_db_path(bucket, tenant_key)
+    with _db_cache_lock:
+        _in_flight.add(local_in)
 
-    # Apply migration
-    conn = sqlite3.connect(local_in)
+    try:
+        # Download DB unless the copy left by an earlier migration is still current
+        head = s3.head_object(Bucket=bucket, Key=tenant_key)
+        cached = _etag_cache.pop(local_in, None)  # the file diverges from S3 until re-uploaded
+        if cached and cached[0] == head["ETag"] and os.path.exists(local_in):
+            print(f"Reusing cached DB for {bucket}/{tenant_key}")
+        else:
+            download_db(s3, bucket, tenant_key, local_in, head.get("ContentEncoding", ""), Config=TRANSFER_CONFIG)
+
+        # Apply migration
+        conn = sqlite3.connect(local_in)
+        conn.executescript(CONNECTION_PRAGMAS)
+
+        apply_ops_to_tenant_db(conn, operations)
+
+        # Upload back (overwrite same key). You may prefer versioned keys for safety.
+        s3.upload_file(
+            local_in, bucket, tenant_key,
+            ExtraArgs={"ContentType": "application/x-sqlite3"},
+            Config=TRANSFER_CONFIG
+        )
+        cache_migrated_db(local_in, upload_etag(local_in))
 
-    apply_ops_to_tenant_db(conn, operations)
+    except Exception:
+        # Don't leave a half-migrated file behind in /tmp
+        try:
+            os.unlink(local_in)
+        except OSError:
+            pass
+        raise
 
-    # Upload back (overwrite same key). You may prefer versioned keys for safety.
-    s3.upload_file(local_in, bucket, tenant_key)
+    finally:
+        with _db_cache_lock:
+            _in_flight.discard(local_in)
 
     # if bucket == PRIMARY_S3_BUCKET and CACHE_REFRESH_FUNCTION and tenant_id:
     #     payload = {
@@ -257,41 +386,66 @@ def handler_one_message(migration_id, bucket, schema_key, tenant_key, operations
     #     )
 
 
+def process_record(body):
+    migration_id = body["migrationId"]
+
+    bucket = body["bucket"]
+    schema_key = body["schemaS3Key"]
+    tenant_key = body["tenantS3Key"]
+    operations = body.get("operations", [])
+    tenant_id = body.get("tenantId")
+    tenant_name = body.get("tenantName", "")
+
+    handler_one_message(migration_id, bucket, schema_key, tenant_key, operations)
+
+    # Invalidate Redis cache for primary tenant DB reads
+    if bucket == PRIMARY_BUCKET and tenant_id:
+        bump_cache_version(tenant_id)
+
+    # Refresh EFS hot cache ONLY for the primary tenant DB
+    if bucket == PRIMARY_BUCKET and tenant_id and body.get("refreshHotCache", True):
+        tier = get_tenant_storage_tier(tenant_id)
+        print(f"[cache-refresh] tenant_id={tenant_id} storage_tier={tier}")
+
+        # If you want: refresh only if HOT (recommended)
+        if tier == "HOT":
+            try:
+                invoke_rehydration(tenant_id, tenant_name, bucket, tenant_key, migration_id)
+                print("[cache-refresh] Rehydration queued")
+            except Exception as e:
+                print(f"[cache-refresh] WARNING: failed: {str(e)}")
+
+
+def process_records_in_order(bodies):
+    for body in bodies:
+        process_record(body)
+
+
 def lambda_handler(event, context):
     # bucket = "octodb-tenants-bucket"
 
     # SQS batch: event["Records"]
     print(event.get("Records", []))
+
+    # Records for the same DB object must apply in queue order; different DBs
+    # (tenant, read-only replica, standby replica, other tenants) are independent,
+    # so their download -> migrate -> upload cycles overlap.
+    bodies_by_db = {}
     for record in event.get("Records", []):
-        body = json.loads(record["body"])
-        # print(body)
-        migration_id = body["migrationId"]
-
-        bucket = body["bucket"]
-        schema_key = body["schemaS3Key"]
-        tenant_key = body["tenantS3Key"]
-        operations = body.get("operations", [])
-        tenant_id = body.get("tenantId")
-        tenant_name = body.get("tenantName", "")
-
-        handler_one_message(migration_id, bucket, schema_key, tenant_key, operations)
-
-        # Invalidate Redis cache for primary tenant DB reads
-        if bucket == PRIMARY_BUCKET and tenant_id:
-            bump_cache_version(tenant_id)
-
-        # Refresh EFS hot cache ONLY for the primary tenant DB
-        if bucket == PRIMARY_BUCKET and tenant_id and body.get("refreshHotCache", True):
-            tier = get_tenant_storage_tier(tenant_id)
-            print(f"[cache-refresh] tenant_id={tenant_id} storage_tier={tier}")
-
-            # If you want: refresh only if HOT (recommended)
-            if tier == "HOT":
-                try:
-                    invoke_rehydration(tenant_id, tenant_name, bucket, tenant_key)
-                    print("[cache-refresh] Rehydration completed")
-                except Exception as e:
-                    print(f"[cache-refresh] WARNING: failed: {str(e)}")
+        body = loads(record["body"])
+        bodies_by_db.setdefault((body["bucket"], body["tenantS3Key"]), []).append(body)
+
+    futures = [_executor.submit(process_records_in_order, bodies) for bodies in bodies_by_db.values()]
+    errors = []
+    for future in futures:
+        try:
+            future.result()
+        except Exception as e:
+            print(f"ERROR: Migration failed: {str(e)}")
+            errors.append(e)
+    if errors:
+        # Fail the invocation so SQS redelivers the batch, as before
+        raise errors[0]
 
     return {
         'statusCode': 200,
@@ -1,159 +1,792 @@
 import os
+import re
 import json
+import hmac
+import hashlib
+import logging
 import boto3
 import sqlite3
-import tempfile
-from boto3.dynamodb.conditions import Key
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from octodb_shared import (
+    CLIENT_CONFIG, auth_token_valid, db_transfer_config, download_zstd, dumps, loads
+)
 
-s3 = boto3.client('s3')
-dynamodb = boto3.resource('dynamodb')
+try:
+    import apsw  # provided via Lambda Layer
+except Exception:
+    apsw = None
+
+# Structured logs, WARNING and above unless LOG_LEVEL says otherwise
+logger = logging.getLogger()
+logger.setLevel(os.environ.get('LOG_LEVEL', 'WARNING'))
+
+
+def log_event(level, event, **fields):
+    # Checked first so disabled levels skip building the JSON entirely
+    if logger.isEnabledFor(level):
+        logger.log(level, json.dumps({'event': event, **fields}, default=str))
+
+
+s3 = boto3.client('s3', config=CLIENT_CONFIG)
+
+# Tenant DBs over 8 MB move as 16 concurrent ranged GETs / multipart PUTs
+TRANSFER_CONFIG = db_transfer_config(max_concurrency=16)
+
+# Low-level client: skips the resource layer's per-call (un)marshalling
+dynamodb = boto3.client('dynamodb', config=CLIENT_CONFIG)
 
 TENANT_METADATA_TABLE = os.environ.get('TENANT_METADATA_TABLE', 'octodb-tenants')
 REPLICA_METADATA_TABLE = os.environ.get('REPLICA_METADATA_TABLE', 'tenant-metadata')
 TENANT_NAME_INDEX = os.environ.get('TENANT_NAME_INDEX', 'Tenant_Name_Index')
 
+# Tenant and replica rows change only at provisioning; warm invocations reuse
+# them for a short while instead of reading DynamoDB on every request
+METADATA_CACHE_TTL_SECONDS = float(os.environ.get('METADATA_CACHE_TTL_SECONDS', '60'))
+METADATA_CACHE_SIZE = 1024
+_tenant_cache = {}  # tenant_name -> (expires_at, item), oldest first
+_replica_cache = {}  # tenant_id -> (expires_at, item), oldest first
+# Cached tenant rows keep only a salted SHA-256 of api_key; the salt never
+# leaves this container
+_API_KEY_SALT = os.urandom(16)
+
+# DBs below this size are fetched with one GET instead of the managed transfer
+# (and served from :memory: for that request only if /tmp can't take them)
+MEMORY_DB_MAX_BYTES = int(os.environ.get('MEMORY_DB_MAX_BYTES', str(64 * 1024 * 1024)))
+
+# Warm invocations reuse the last copy of each DB kept in /tmp while its ETag is unchanged
+DB_CACHE_DIR = os.environ.get('DB_CACHE_DIR', '/tmp')
+DB_CACHE_MAX_BYTES = int(os.environ.get('DB_CACHE_MAX_BYTES', str(384 * 1024 * 1024)))
+_DB_CACHE = {}  # db_path -> (etag, local_path, size), oldest first
+
+# Open connections stay warm across invocations while their DB's ETag is unchanged
+CONN_CACHE_SIZE = int(os.environ.get('CONN_CACHE_SIZE', '16'))
+_CONN_CACHE = {}  # db_path -> (etag, conn, lock), oldest first
+
+FETCH_CHUNK_ROWS = 1000
+
+# Read-side tuning for every replica connection: map the /tmp file instead of
+# read() syscalls, a 64 MB page cache, and sorts/temp indexes kept in memory
+# (the file is immutable, so journal and sync settings never come into play)
+READ_PRAGMAS = f'''
+PRAGMA mmap_size = {256 * 1024 * 1024};
+PRAGMA cache_size = -65536;
+PRAGMA temp_store = MEMORY;
+'''
+
+# Guards against runaway queries pinning the Lambda: wall-clock budget per query
+# (checked every PROGRESS_CHECK_OPS VM steps) and a cap on returned rows
+QUERY_TIMEOUT_SECONDS = float(os.environ.get('QUERY_TIMEOUT_SECONDS', '10'))
+MAX_RESULT_ROWS = int(os.environ.get('MAX_RESULT_ROWS', '100000'))
+PROGRESS_CHECK_OPS = 10000
+
+# Opt-in query governor: reject plans that read every row of a table with more
+# than this many rows (estimated from max(rowid)); 0 disables
+FULL_SCAN_MAX_ROWS = int(os.environ.get('FULL_SCAN_MAX_ROWS', '0'))
+FULL_SCAN_PLAN = re.compile(r'SCAN (?:TABLE )?(\S+)')
+
+# DBs at least this large that aren't already in /tmp are queried in place:
+# SQLite's page reads become ranged GETs instead of a full download (needs apsw;
+# 0 disables). Fetched blocks are kept per ETag across warm invocations.
+RANGE_READ_MIN_BYTES = int(os.environ.get('RANGE_READ_MIN_BYTES', str(256 * 1024 * 1024)))
+RANGE_BLOCK_BYTES = 256 * 1024
+RANGE_CACHE_BLOCKS = int(os.environ.get('RANGE_CACHE_BLOCKS', '256'))
+_RANGE_BLOCKS = {}  # (db_path, etag, block index) -> bytes, least recently used first
+_RANGE_TARGETS = {}  # VFS filename -> (bucket, db_path, etag, size)
+
+# Once SQLite reads blocks in order (a table or index scan), the next
+# RANGE_READAHEAD_BLOCKS are fetched concurrently while it works through the
+# current one, instead of one blocking GET per block; 0 disables
+RANGE_READAHEAD_BLOCKS = int(os.environ.get('RANGE_READAHEAD_BLOCKS', '8'))
+_RANGE_PENDING = {}  # (db_path, etag, block index) -> Future of the block's GET
+_range_executor = ThreadPoolExecutor(max_workers=max(RANGE_READAHEAD_BLOCKS, 1))
+
 
 def lambda_handler(event, context):
+    started = time.monotonic()
     try:
         # Parse the POST request body
         if 'body' not in event:
             return create_response(400, {'error': 'Request body is missing'})
         
-        body = json.loads(event['body']) if isinstance(event['body'], str) else event['body']
+        body = loads(event['body']) if isinstance(event['body'], str) else event['body']
         
         # Validate required fields
         tenant_name = body.get('tenant_name')
         api_key = body.get('api_key')
         sql_query = body.get('sql_query')
+        # Optional bind parameters: a list for ? placeholders or an object for :name
+        params = body.get('params')
+        # 'jsonl': a header line with the column names, then one compact array per row
+        result_format = body.get('format', 'json')
         
         if not tenant_name or not api_key or not sql_query:
             return create_response(400, {
                 'error': 'Missing required fields. Please provide tenant_name, api_key, and sql_query'
             })
         
-        # Step 1: Query tenant metadata table using tenant_name index
-        tenant_table = dynamodb.Table(TENANT_METADATA_TABLE)
+        # Signed tenant token: forged requests are turned away before any DynamoDB read
+        if not auth_token_valid(tenant_name, body.get('auth_token')):
+            log_event(logging.WARNING, 'invalid_auth_token', tenant=tenant_name)
+            return create_response(401, {
+                'error': 'Invalid auth token'
+            })
+        
+        if params is None:
+            params = ()
+        elif not isinstance(params, (list, dict)):
+            return create_response(400, {
+                'error': 'params must be a list (positional) or an object (named)'
+            })
+        
+        if result_format not in ('json', 'jsonl'):
+            return create_response(400, {
+                'error': 'Invalid format. Use "json" or "jsonl"'
+            })
+        jsonl = result_format == 'jsonl'
         
+        # Step 1: Query tenant metadata table using tenant_name index
         try:
-            response = tenant_table.query(
-                IndexName=TENANT_NAME_INDEX,
-                KeyConditionExpression=Key('tenant_name').eq(tenant_name)
-            )
+            tenant_item = lookup_tenant(tenant_name)
         except Exception as e:
+            log_event(logging.ERROR, 'tenant_lookup_failed', tenant=tenant_name, error=str(e))
             return create_response(500, {
                 'error': f'Failed to query tenant metadata: {str(e)}'
             })
         
         # Check if tenant exists
-        if not response.get('Items'):
+        if tenant_item is None:
+            log_event(logging.WARNING, 'tenant_not_found', tenant=tenant_name)
             return create_response(404, {
                 'error': f'Tenant "{tenant_name}" not found'
             })
         
-        tenant_item = response['Items'][0]
-        
         # Validate API key
-        if tenant_item.get('api_key') != api_key:
+        if not api_key_matches(tenant_item.get('api_key_digest'), api_key):
+            # Re-read next time: the key may have just been rotated
+            _tenant_cache.pop(tenant_name, None)
+            log_event(logging.WARNING, 'invalid_api_key', tenant=tenant_name)
             return create_response(401, {
                 'error': 'Invalid API key'
             })
         
         # Step 2: Get tenant_id from tenant metadata
-        tenant_id = tenant_item.get('tenant_id')
+        tenant_id = attr_string(tenant_item, 'tenant_id')
         if not tenant_id:
+            log_event(logging.ERROR, 'tenant_id_missing', tenant=tenant_name)
             return create_response(500, {
                 'error': 'Tenant ID not found in metadata'
             })
         
-        # Step 3: Get replica metadata using tenant_id
-        replica_table = dynamodb.Table(REPLICA_METADATA_TABLE)
-        
-        try:
-            replica_response = replica_table.get_item(
-                Key={'tenantId': tenant_id}
-            )
-        except Exception as e:
-            return create_response(500, {
-                'error': f'Failed to query replica metadata: {str(e)}'
-            })
+        # Step 3: Get replica metadata. Tenants whose row already carries it
+        # (denormalized at provisioning) skip this DynamoDB round trip.
+        replica_item = embedded_replica_metadata(tenant_item)
+        if replica_item is None:
+            try:
+                replica_item = lookup_replica(tenant_id)
+            except Exception as e:
+                log_event(logging.ERROR, 'replica_lookup_failed', tenant_id=tenant_id, error=str(e))
+                return create_response(500, {
+                    'error': f'Failed to query replica metadata: {str(e)}'
+                })
         
-        if 'Item' not in replica_response:
-            return create_response(404, {
-                'error': f'Replica metadata not found for tenant_id "{tenant_id}"'
-            })
+            if replica_item is None:
+                log_event(logging.ERROR, 'replica_not_found', tenant_id=tenant_id)
+                return create_response(404, {
+                    'error': f'Replica metadata not found for tenant_id "{tenant_id}"'
+                })
+            
+            # Older tenant: copy the fields onto its row so later lookups take one call
+            backfill_replica_fields(tenant_item, tenant_id, replica_item)
         
-        replica_item = replica_response['Item']
-        read_only_bucket = replica_item.get('read_only_bucket')
-        db_path = replica_item.get('db_path')
+        read_only_bucket = attr_string(replica_item, 'read_only_bucket')
+        db_path = attr_string(replica_item, 'db_path')
         
         if not read_only_bucket or not db_path:
+            log_event(logging.ERROR, 'replica_location_missing', tenant_id=tenant_id)
             return create_response(500, {
                 'error': 'Read-only bucket or database path not found in replica metadata'
             })
         
-        # Step 4: Download DB file from S3 and execute query
-        with tempfile.NamedTemporaryFile(delete=False) as tmp_file:
-            tmp_db_path = tmp_file.name
-            
-            try:
-                # Download the database file from S3
-                s3.download_file(read_only_bucket, db_path, tmp_db_path)
-            except Exception as e:
-                return create_response(500, {
-                    'error': f'Failed to download database from S3: {str(e)}'
-                })
+        # Step 4: Load DB file from S3 and execute query
+        try:
+            db_bytes, local_db_path, etag, range_size = fetch_replica_db(read_only_bucket, db_path, tenant_id)
+            fetched = time.monotonic()
+        except Exception as e:
+            log_event(logging.ERROR, 'db_fetch_failed', tenant_id=tenant_id, db_path=db_path, error=str(e))
+            return create_response(500, {
+                'error': f'Failed to download database from S3: {str(e)}'
+            })
+        
+        if range_size is not None:
+            return query_in_place(read_only_bucket, db_path, etag, range_size, sql_query, params, jsonl)
+        
+        try:
+            # Connect to SQLite database (reused while the ETag matches) and execute query
+            conn, lock = connect_replica_db(db_path, etag, db_bytes, local_db_path)
+            lock.acquire()
+            deadline = time.monotonic() + QUERY_TIMEOUT_SECONDS
+            # Non-zero return aborts the statement with OperationalError('interrupted')
+            conn.set_progress_handler(lambda: time.monotonic() > deadline, PROGRESS_CHECK_OPS)
+            cursor = conn.cursor()
             
             try:
-                # Connect to SQLite database and execute query
-                conn = sqlite3.connect(tmp_db_path)
-                conn.row_factory = sqlite3.Row  # Enable column name access
-                cursor = conn.cursor()
+                scan = oversized_scan(conn, sql_query, params)
+                if scan:
+                    log_event(logging.WARNING, 'full_scan_rejected', table=scan[0], rows=scan[1])
+                    return create_response(400, {
+                        'error': f'Query would scan all ~{scan[1]} rows of {scan[0]}; filter on an indexed column'
+                    })
+                
+                cursor.execute(sql_query, params)
+                
+                # Convert rows to list of dictionaries (or JSONL lines), a chunk at a
+                # time so the full result set is never held twice
+                columns = [column[0] for column in cursor.description or ()]
+                result = []
+                rows = cursor.fetchmany(FETCH_CHUNK_ROWS)
+                while rows:
+                    if jsonl:
+                        result.extend(dumps(tuple(row)) for row in rows)
+                    else:
+                        result.extend(dict(row) for row in rows)
+                    if len(result) > MAX_RESULT_ROWS:
+                        log_event(logging.WARNING, 'result_too_large', tenant_id=tenant_id, max_rows=MAX_RESULT_ROWS)
+                        return create_response(413, {
+                            'error': f'Query returned more than {MAX_RESULT_ROWS} rows; add a LIMIT'
+                        })
+                    rows = cursor.fetchmany(FETCH_CHUNK_ROWS)
                 
-                try:
-                    cursor.execute(sql_query)
-                    rows = cursor.fetchall()
-                    
-                    # Convert rows to list of dictionaries
-                    result = [dict(row) for row in rows]
-                    
-                    return create_response(200, {
+                log_event(
+                    logging.INFO, 'read', tenant_id=tenant_id, row_count=len(result),
+                    fetch_ms=round((fetched - started) * 1000, 1),
+                    query_ms=round((time.monotonic() - fetched) * 1000, 1)
+                )
+                
+                if jsonl:
+                    return create_jsonl_response(200, {
                         'success': True,
-                        'data': result,
+                        'columns': columns,
                         'row_count': len(result),
                         'source': {
                             'region': 'us-east-1',
                         }
+                    }, result)
+                return create_response(200, {
+                    'success': True,
+                    'data': result,
+                    'row_count': len(result),
+                    'source': {
+                        'region': 'us-east-1',
+                    }
+                })
+                
+            except sqlite3.Error as e:
+                if time.monotonic() > deadline:
+                    log_event(logging.WARNING, 'query_timeout', tenant_id=tenant_id, timeout_s=QUERY_TIMEOUT_SECONDS)
+                    return create_response(408, {
+                        'error': f'SQL query exceeded the {QUERY_TIMEOUT_SECONDS:g}s time limit'
                     })
-                    
-                except sqlite3.Error as e:
-                    return create_response(400, {
-                        'error': f'SQL query execution failed: {str(e)}'
-                    })
-                finally:
-                    cursor.close()
-                    conn.close()
-                    
-            except Exception as e:
-                return create_response(500, {
-                    'error': f'Database connection error: {str(e)}'
+                return create_response(400, {
+                    'error': f'SQL query execution failed: {str(e)}'
                 })
             finally:
-                # Clean up temporary file
-                try:
-                    os.unlink(tmp_db_path)
-                except:
-                    pass
+                cursor.close()
+                # Don't leave a statement like BEGIN open on the shared connection
+                if conn.in_transaction:
+                    conn.rollback()
+                conn.set_progress_handler(None, 0)
+                lock.release()
+                if db_bytes is not None:
+                    conn.close()  # One-off in-memory copy, never cached
+                
+        except Exception as e:
+            log_event(logging.ERROR, 'db_connect_failed', tenant_id=tenant_id, error=str(e))
+            return create_response(500, {
+                'error': f'Database connection error: {str(e)}'
+            })
     
     except json.JSONDecodeError:
         return create_response(400, {
             'error': 'Invalid JSON in request body'
         })
     except Exception as e:
+        log_event(logging.ERROR, 'unexpected_error', error=str(e))
         return create_response(500, {
             'error': f'Unexpected error: {str(e)}'
         })
 
 
+def fetch_replica_db(bucket, key, tenant_id):
+    """
+    Fetch the tenant DB, reusing the /tmp copy while its ETag is unchanged.
+    Small DBs are fetched with a single GET and written to /tmp; only when
+    that write fails do they come back as bytes to deserialize in memory for
+    this request. Large uncached DBs are left in S3 for query_in_place when
+    apsw is available. Returns (bytes, local_path, etag, range_size);
+    range_size is set only in that case, and bytes and local_path are both
+    None when a warm connection for this ETag exists.
+    """
+    head = s3.head_object(Bucket=bucket, Key=key)
+    etag = head['ETag']
+    conn_entry = _CONN_CACHE.get(key)
+    if conn_entry and conn_entry[0] == etag:
+        return None, None, etag, None
+    cached = _DB_CACHE.get(key)
+    if cached and cached[0] == etag and os.path.exists(cached[1]):
+        return None, cached[1], etag, None
+    size = head['ContentLength']
+    # zstd-encoded DBs (DB_COMPRESSION on the writer) can't be range-read and
+    # are always decompressed into /tmp
+    compressed = head.get('ContentEncoding') == 'zstd'
+    if apsw and RANGE_READ_MIN_BYTES and size >= RANGE_READ_MIN_BYTES and not compressed:
+        return None, None, etag, size
+
+    # Drop the stale entry first so a failed refresh never serves a partial file
+    _DB_CACHE.pop(key, None)
+    local_path = os.path.join(DB_CACHE_DIR, f'{tenant_id}.sqlite')
+    if compressed:
+        # ContentLength is the compressed size; reserve room for the decoded DB
+        size = download_zstd(s3, bucket, key, local_path, reserve=lambda n: make_db_cache_room(n, local_path))
+        _DB_CACHE[key] = (etag, local_path, size)
+        return None, local_path, etag, None
+    make_db_cache_room(size, local_path)
+    if size < MEMORY_DB_MAX_BYTES:
+        db_bytes = s3.get_object(Bucket=bucket, Key=key)['Body'].read()
+        try:
+            with open(local_path, 'wb') as f:
+                f.write(db_bytes)
+        except OSError:
+            return db_bytes, None, etag, None  # /tmp full: serve this request from memory
+        _DB_CACHE[key] = (etag, local_path, size)
+        return None, local_path, etag, None
+
+    download_preallocated(bucket, key, local_path, size)
+    _DB_CACHE[key] = (etag, local_path, size)
+    return None, local_path, etag, None
+
+
+def download_preallocated(bucket, key, local_path, size):
+    """
+    Download to local_path through a .part file preallocated at the object's
+    size: the concurrent ranged GETs write into allocated extents instead of
+    growing the file, and the rename never exposes a half-written copy
+    """
+    part_path = local_path + '.part'
+    try:
+        with open(part_path, 'wb') as f:
+            try:
+                os.posix_fallocate(f.fileno(), 0, size)
+            except (AttributeError, OSError):
+                pass  # Empty object or no fallocate here: download without it
+            s3.download_fileobj(bucket, key, f, Config=TRANSFER_CONFIG)
+        os.replace(part_path, local_path)
+    except Exception:
+        if os.path.exists(part_path):
+            os.unlink(part_path)
+        raise
+
+
+def make_db_cache_room(size, local_path):
+    """Evict the oldest /tmp copies so a new one of `size` bytes fits in DB_CACHE_MAX_BYTES"""
+    # An entry for another key at the same path (tenant DB moved) is about to be overwritten
+    for key in [k for k, entry in _DB_CACHE.items() if entry[1] == local_path]:
+        _DB_CACHE.pop(key)
+
+    cached_bytes = sum(entry[2] for entry in _DB_CACHE.values())
+    while _DB_CACHE and cached_bytes + size > DB_CACHE_MAX_BYTES:
+        _, old_path, old_size = _DB_CACHE.pop(next(iter(_DB_CACHE)))
+        cached_bytes -= old_size
+        try:
+            os.unlink(old_path)
+        except OSError:
+            pass
+
+
+def connect_replica_db(key, etag, db_bytes, local_db_path):
+    """
+    Return (conn, lock) for the DB, reusing the warm connection while the ETag
+    matches. Cached connections always read the /tmp file, so the page cache
+    holds what is resident. db_bytes (/tmp was full) gives a one-off :memory:
+    connection that isn't cached; the caller closes it.
+    """
+    cached = _CONN_CACHE.get(key)
+    if cached and cached[0] == etag:
+        conn = cached[1]
+        # Re-assert per request: a previous query could have switched it off
+        conn.execute('PRAGMA query_only = ON')
+        return conn, cached[2]
+    if cached:
+        _CONN_CACHE.pop(key)
+        cached[1].close()
+
+    if db_bytes is not None:
+        conn = sqlite3.connect(':memory:', check_same_thread=False)
+        conn.deserialize(db_bytes)
+    else:
+        # immutable=1: the replica file never changes under us, so SQLite skips
+        # journal and locking work entirely
+        conn = sqlite3.connect(f'file:{local_db_path}?mode=ro&immutable=1', uri=True, check_same_thread=False)
+    conn.row_factory = sqlite3.Row  # Enable column name access
+    conn.executescript(READ_PRAGMAS)
+    conn.execute('PRAGMA query_only = ON')
+    if db_bytes is not None:
+        return conn, threading.Lock()
+
+    while len(_CONN_CACHE) >= CONN_CACHE_SIZE:
+        _, old_conn, _ = _CONN_CACHE.pop(next(iter(_CONN_CACHE)))
+        old_conn.close()
+    lock = threading.Lock()  # sqlite3 connections are not safe to share across threads
+    _CONN_CACHE[key] = (etag, conn, lock)
+    return conn, lock
+
+
+def query_in_place(bucket, key, etag, size, sql_query, params=(), jsonl=False):
+    """
+    Run a read-only query straight against the S3 object through the s3range
+    VFS, with the same time and row limits as the downloaded path
+    """
+    if not single_statement(sql_query):
+        return create_response(400, {
+            'error': 'SQL query execution failed: You can only execute one statement at a time.'
+        })
+
+    filename = f'/{bucket}/{key}'
+    _RANGE_TARGETS[filename] = (bucket, key, etag, size)
+    try:
+        # NOMUTEX: the connection never leaves this thread (readahead threads only fetch
+        # bytes), so SQLite can skip its per-call mutex
+        conn = apsw.Connection(
+            filename,
+            flags=apsw.SQLITE_OPEN_READONLY | apsw.SQLITE_OPEN_NOMUTEX,
+            vfs=S3_RANGE_VFS.vfs_name
+        )
+    except apsw.Error as e:
+        log_event(logging.ERROR, 'db_connect_failed', db_path=key, error=str(e))
+        return create_response(500, {
+            'error': f'Database connection error: {str(e)}'
+        })
+
+    # Same tuning as the downloaded path; mmap has no effect without a local file
+    conn.execute(READ_PRAGMAS)
+
+    started = time.monotonic()
+    deadline = started + QUERY_TIMEOUT_SECONDS
+    conn.set_progress_handler(lambda: time.monotonic() > deadline, PROGRESS_CHECK_OPS)
+    try:
+        scan = oversized_scan(conn, sql_query, params)
+        if scan:
+            log_event(logging.WARNING, 'full_scan_rejected', table=scan[0], rows=scan[1])
+            return create_response(400, {
+                'error': f'Query would scan all ~{scan[1]} rows of {scan[0]}; filter on an indexed column'
+            })
+
+        cursor = conn.cursor().execute(sql_query, params)
+        try:
+            columns = [column[0] for column in cursor.get_description()]
+        except apsw.ExecutionCompleteError:
+            columns = []  # No rows
+        result = []
+        for row in cursor:
+            result.append(dumps(row) if jsonl else dict(zip(columns, row)))
+            if len(result) > MAX_RESULT_ROWS:
+                log_event(logging.WARNING, 'result_too_large', db_path=key, max_rows=MAX_RESULT_ROWS)
+                return create_response(413, {
+                    'error': f'Query returned more than {MAX_RESULT_ROWS} rows; add a LIMIT'
+                })
+
+        log_event(
+            logging.INFO, 'read', db_path=key, row_count=len(result), ranged=True,
+            query_ms=round((time.monotonic() - started) * 1000, 1)
+        )
+
+        if jsonl:
+            return create_jsonl_response(200, {
+                'success': True,
+                'columns': columns,
+                'row_count': len(result),
+                'source': {
+                    'region': 'us-east-1',
+                }
+            }, result)
+        return create_response(200, {
+            'success': True,
+            'data': result,
+            'row_count': len(result),
+            'source': {
+                'region': 'us-east-1',
+            }
+        })
+
+    except apsw.Error as e:
+        if time.monotonic() > deadline:
+            log_event(logging.WARNING, 'query_timeout', db_path=key, timeout_s=QUERY_TIMEOUT_SECONDS)
+            return create_response(408, {
+                'error': f'SQL query exceeded the {QUERY_TIMEOUT_SECONDS:g}s time limit'
+            })
+        return create_response(400, {
+            'error': f'SQL query execution failed: {str(e)}'
+        })
+    finally:
+        conn.close()
+        finish_range_readahead()
+
+
+def oversized_scan(conn, sql_query, params):
+    """
+    (table, estimated rows) for the first full-table scan in the query plan over
+    FULL_SCAN_MAX_ROWS, or None. Works on both sqlite3 and apsw connections.
+    """
+    if not FULL_SCAN_MAX_ROWS:
+        return None
+    for step in list(conn.execute(f'EXPLAIN QUERY PLAN {sql_query}', params)):
+        match = FULL_SCAN_PLAN.match(step[3])
+        if not match:
+            continue
+        table = match.group(1)
+        quoted = table.replace('"', '""')
+        try:
+            rows = next(iter(conn.execute(f'SELECT max(rowid) FROM "{quoted}"')))[0]
+        except Exception:
+            continue  # Alias, CTE or subquery: not a table we can size
+        if rows and rows > FULL_SCAN_MAX_ROWS:
+            return table, rows
+    return None
+
+
+def single_statement(sql):
+    """apsw runs every statement in a string; match sqlite3's one-statement rule"""
+    statements = 0
+    pending = ''
+    for part in sql.split(';'):
+        pending += part + ';'
+        if sqlite3.complete_statement(pending):
+            if pending.strip().strip(';').strip():
+                statements += 1
+            pending = ''
+    return statements <= 1
+
+
+def read_range_block(bucket, key, etag, size, index):
+    """One RANGE_BLOCK_BYTES block of the object, from the LRU, a readahead GET or a ranged GET"""
+    cache_key = (key, etag, index)
+    block = _RANGE_BLOCKS.pop(cache_key, None)
+    if block is None:
+        pending = _RANGE_PENDING.pop(cache_key, None)
+        block = pending.result() if pending else get_range_block(bucket, key, etag, size, index)
+        while len(_RANGE_BLOCKS) >= RANGE_CACHE_BLOCKS:
+            _RANGE_BLOCKS.pop(next(iter(_RANGE_BLOCKS)))
+    _RANGE_BLOCKS[cache_key] = block
+    return block
+
+
+def get_range_block(bucket, key, etag, size, index):
+    first = index * RANGE_BLOCK_BYTES
+    last = min(first + RANGE_BLOCK_BYTES, size) - 1
+    # IfMatch: a snapshot replaced mid-query fails the read instead of mixing versions
+    return s3.get_object(Bucket=bucket, Key=key, Range=f'bytes={first}-{last}', IfMatch=etag)['Body'].read()
+
+
+def start_range_readahead(bucket, key, etag, size, index):
+    """Start background GETs for the blocks after `index` that aren't cached or in flight"""
+    last_block = (size - 1) // RANGE_BLOCK_BYTES
+    for ahead in range(index + 1, min(index + RANGE_READAHEAD_BLOCKS, last_block) + 1):
+        cache_key = (key, etag, ahead)
+        if cache_key not in _RANGE_BLOCKS and cache_key not in _RANGE_PENDING:
+            _RANGE_PENDING[cache_key] = _range_executor.submit(get_range_block, bucket, key, etag, size, ahead)
+
+
+def finish_range_readahead():
+    """
+    Wait for readahead GETs still in flight (the environment is frozen once the
+    handler returns) and keep the blocks that arrived for the next query
+    """
+    wait(_RANGE_PENDING.values())
+    for cache_key, future in _RANGE_PENDING.items():
+        if future.exception() is None:
+            while len(_RANGE_BLOCKS) >= RANGE_CACHE_BLOCKS:
+                _RANGE_BLOCKS.pop(next(iter(_RANGE_BLOCKS)))
+            _RANGE_BLOCKS[cache_key] = future.result()
+    _RANGE_PENDING.clear()
+
+
+if apsw:
+    class S3RangeFile:
+        """Read-only SQLite main DB file backed by ranged GETs on one S3 object version"""
+
+        def __init__(self, bucket, key, etag, size):
+            self.bucket = bucket
+            self.key = key
+            self.etag = etag
+            self.size = size
+            self.last_index = None
+
+        def xRead(self, amount, offset):
+            end = min(offset + amount, self.size)
+            data = bytearray()
+            while offset < end:
+                index = offset // RANGE_BLOCK_BYTES
+                if RANGE_READAHEAD_BLOCKS and self.last_index == index - 1:
+                    start_range_readahead(self.bucket, self.key, self.etag, self.size, index)
+                self.last_index = index
+                block = read_range_block(self.bucket, self.key, self.etag, self.size, index)
+                start = offset - index * RANGE_BLOCK_BYTES
+                piece = block[start:start + end - offset]
+                data += piece
+                offset += len(piece)
+            # A short read past EOF is zero-filled by apsw, as SQLite expects
+            return bytes(data)
+
+        def xFileSize(self):
+            return self.size
+
+        def xDeviceCharacteristics(self):
+            return apsw.SQLITE_IOCAP_IMMUTABLE
+
+        def xSectorSize(self):
+            return 4096
+
+        def xFileControl(self, op, pointer):
+            return False
+
+        def xCheckReservedLock(self):
+            return False
+
+        def xLock(self, level):
+            pass
+
+        def xUnlock(self, level):
+            pass
+
+        def xSync(self, flags):
+            pass
+
+        def xWrite(self, data, offset):
+            raise apsw.ReadOnlyError('s3range files are read-only')
+
+        def xTruncate(self, size):
+            raise apsw.ReadOnlyError('s3range files are read-only')
+
+        def xClose(self):
+            pass
+
+    class S3RangeVFS(apsw.VFS):
+        """Serves main DB files from S3; everything else goes to the default VFS"""
+
+        def __init__(self):
+            self.vfs_name = 's3range'
+            super().__init__(self.vfs_name, base='')
+
+        def xOpen(self, name, flags):
+            filename = name.filename() if isinstance(name, apsw.URIFilename) else name
+            if filename in _RANGE_TARGETS and flags[0] & apsw.SQLITE_OPEN_MAIN_DB:
+                flags[1] = flags[0]
+                return S3RangeFile(*_RANGE_TARGETS[filename])
+            return super().xOpen(name, flags)
+
+    S3_RANGE_VFS = S3RangeVFS()
+
+
+def attr_string(item, name):
+    """Read a string attribute from a low-level DynamoDB item"""
+    return item.get(name, {}).get('S')
+
+
+def lookup_tenant(tenant_name):
+    """Tenant row for tenant_name, or None; reused across warm invocations for METADATA_CACHE_TTL_SECONDS"""
+    item = cache_get(_tenant_cache, tenant_name)
+    if item is None:
+        response = dynamodb.query(
+            TableName=TENANT_METADATA_TABLE,
+            IndexName=TENANT_NAME_INDEX,
+            KeyConditionExpression='tenant_name = :tname',
+            ExpressionAttributeValues={':tname': {'S': tenant_name}},
+            ProjectionExpression='api_key, tenant_id, current_db_path, read_only_bucket',
+            Limit=1  # Only Items[0] is used
+        )
+        if not response.get('Items'):
+            return None
+        item = response['Items'][0]
+        api_key = attr_string(item, 'api_key')
+        item.pop('api_key', None)
+        item['api_key_digest'] = api_key_digest(api_key) if api_key else None
+        cache_put(_tenant_cache, tenant_name, item)
+    return item
+
+
+def lookup_replica(tenant_id):
+    """Replica metadata row for tenant_id, or None; cached like lookup_tenant"""
+    item = cache_get(_replica_cache, tenant_id)
+    if item is None:
+        response = dynamodb.get_item(
+            TableName=REPLICA_METADATA_TABLE,
+            Key={'tenantId': {'S': tenant_id}},
+            ProjectionExpression='read_only_bucket, db_path'
+        )
+        if 'Item' not in response:
+            return None
+        item = response['Item']
+        cache_put(_replica_cache, tenant_id, item)
+    return item
+
+
+def cache_get(cache, key):
+    entry = cache.get(key)
+    if entry and entry[0] > time.monotonic():
+        return entry[1]
+    cache.pop(key, None)
+    return None
+
+
+def cache_put(cache, key, value):
+    cache.pop(key, None)
+    while len(cache) >= METADATA_CACHE_SIZE:
+        cache.pop(next(iter(cache)))
+    cache[key] = (time.monotonic() + METADATA_CACHE_TTL_SECONDS, value)
+
+
+def backfill_replica_fields(tenant_item, tenant_id, replica_item):
+    """Copy read_only_bucket and db_path onto a tenant row that predates the denormalized fields"""
+    bucket = attr_string(replica_item, 'read_only_bucket')
+    db_path = attr_string(replica_item, 'db_path')
+    if not bucket or not db_path:
+        return
+    try:
+        dynamodb.update_item(
+            TableName=TENANT_METADATA_TABLE,
+            Key={'tenant_id': {'S': tenant_id}},
+            UpdateExpression='SET read_only_bucket = if_not_exists(read_only_bucket, :bucket), '
+                             'current_db_path = if_not_exists(current_db_path, :db_path)',
+            ConditionExpression='attribute_exists(tenant_id)',
+            ExpressionAttributeValues={':bucket': {'S': bucket}, ':db_path': {'S': db_path}}
+        )
+        # The cached row takes the single-call path from now on too
+        tenant_item.setdefault('read_only_bucket', {'S': bucket})
+        tenant_item.setdefault('current_db_path', {'S': db_path})
+    except Exception as e:
+        log_event(logging.WARNING, 'replica_backfill_failed', tenant_id=tenant_id, error=str(e))
+
+
+def embedded_replica_metadata(tenant_item):
+    """Replica fields copied onto the tenant row at provisioning, or None for older tenants"""
+    if 'read_only_bucket' not in tenant_item or 'current_db_path' not in tenant_item:
+        return None
+    return {'read_only_bucket': tenant_item['read_only_bucket'], 'db_path': tenant_item['current_db_path']}
+
+
+def api_key_digest(api_key):
+    """Salted SHA-256 of an API key, the only form kept in the tenant cache"""
+    return hashlib.sha256(_API_KEY_SALT + str(api_key).encode('utf-8')).digest()
+
+
+def api_key_matches(expected_digest, provided):
+    """Constant-time check of a provided API key against the tenant's cached digest"""
+    if not expected_digest or not provided:
+        return False
+    return hmac.compare_digest(expected_digest, api_key_digest(provided))
+
+
 def create_response(status_code, body):
     """Helper function to create standardized API responses"""
     return {
@@ -164,13 +797,13 @@ def create_response(status_code, body):
             'Access-Control-Allow-Headers': 'Content-Type,X-Amz-Date,Authorization,X-Api-Key,X-Amz-Security-Token',
             'Access-Control-Allow-Methods': 'POST,OPTIONS'
         },
-        'body': json.dumps(body)
+        'body': dumps(body)
     }
-    
-    
-    '''{
-        "tenant_name": "Tandon",
-        "api_key": "sk_live_PAC_x0LUbWVUZLzUeBitoTsDbt83bQSNmqf3uaTx-Yo",
-        "sql_query": "SELECT * FROM Users;"
-        } 
-    '''
+
+
+def create_jsonl_response(status_code, header, lines):
+    """Like create_response, with the pre-encoded JSONL rows after the header line"""
+    response = create_response(status_code, header)
+    response['headers']['Content-Type'] = 'application/x-ndjson'
+    response['body'] = '\n'.join([response['body'], *lines])
+    return response
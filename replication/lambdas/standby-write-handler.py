@@ -1,15 +1,45 @@
 import os
 import json
+import hmac
+import hashlib
+import logging
 import boto3
 import sqlite3
-import tempfile
+import time
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, wait
 from boto3.dynamodb.conditions import Key
+from octodb_shared import (
+    CLIENT_CONFIG, auth_token_valid, copy_s3_object, db_transfer_config, download_zstd, dumps, loads
+)
+
+try:
+    import zstandard  # provided via Lambda Layer
+except Exception:
+    zstandard = None
+
+# Structured logs, WARNING and above unless LOG_LEVEL says otherwise
+logger = logging.getLogger()
+logger.setLevel(os.environ.get('LOG_LEVEL', 'WARNING'))
+
+
+def log_event(level, event, **fields):
+    # Checked first so disabled levels skip building the JSON entirely
+    if logger.isEnabledFor(level):
+        logger.log(level, json.dumps({'event': event, **fields}, default=str))
+
 
 # Initialize AWS clients
-s3 = boto3.client('s3')
-dynamodb = boto3.resource('dynamodb')
-sns = boto3.client('sns')
+s3 = boto3.client('s3', config=CLIENT_CONFIG)
+dynamodb = boto3.resource('dynamodb', config=CLIENT_CONFIG)
+sns = boto3.client('sns', config=CLIENT_CONFIG)
+
+# Runs the replica metadata update and the SNS publish off the request thread,
+# overlapped with the snapshot copy
+_executor = ThreadPoolExecutor(max_workers=2)
+
+# Tenant DBs over 8 MB move as 10 concurrent ranged GETs / multipart PUTs
+TRANSFER_CONFIG = db_transfer_config(max_concurrency=10)
 
 # Environment variables
 TENANT_METADATA_TABLE = os.environ.get('TENANT_METADATA_TABLE', 'octodb-tenants')
@@ -17,55 +47,106 @@ REPLICA_METADATA_TABLE = os.environ.get('REPLICA_METADATA_TABLE', 'tenant-metada
 TENANT_NAME_INDEX = os.environ.get('TENANT_NAME_INDEX', 'Tenant_Name_Index')
 SNS_TOPIC_ARN = os.environ.get('SNS_TOPIC_ARN', 'arn:aws:sns:us-east-2:666802050343:Replica_Write_Topic')
 
+# No queued writes here: the batch write handler publishes to the primary
+# region's SNS topic, so a standby write it applied would never reach the
+# standby replicas. Requests with "batch": true are refused.
+
+# Table handles are built once per container, not per invocation
+TENANT_TABLE = dynamodb.Table(TENANT_METADATA_TABLE)
+REPLICA_TABLE = dynamodb.Table(REPLICA_METADATA_TABLE)
+
+# Tenant and replica rows change only at provisioning; warm invocations reuse
+# them for a short while instead of reading DynamoDB on every request
+METADATA_CACHE_TTL_SECONDS = float(os.environ.get('METADATA_CACHE_TTL_SECONDS', '60'))
+METADATA_CACHE_SIZE = 1024
+_tenant_cache = {}  # tenant_name -> (expires_at, item), oldest first
+_replica_cache = {}  # tenant_id -> (expires_at, item), oldest first
+# Cached tenant rows keep only a salted SHA-256 of api_key; the salt never
+# leaves this container
+_API_KEY_SALT = os.urandom(16)
+
+# Warm invocations reuse the last copy of each primary DB kept in /tmp while its
+# S3 ETag is unchanged
+DB_CACHE_DIR = os.environ.get('DB_CACHE_DIR', '/tmp')
+DB_CACHE_MAX_BYTES = int(os.environ.get('DB_CACHE_MAX_BYTES', str(384 * 1024 * 1024)))
+_DB_CACHE = {}  # (bucket, db_path) -> (etag, local_path, size), oldest first
+
+# Opt-in: store primary DBs zstd-compressed (ContentEncoding: zstd), typically
+# 3-5x fewer bytes over the network. Every reader decodes either form through
+# octodb_shared.download_zstd. Needs zstandard.
+DB_COMPRESSION = os.environ.get('DB_COMPRESSION', '').lower()
+ZSTD_LEVEL = int(os.environ.get('ZSTD_LEVEL', '3'))
+COMPRESS_DB = DB_COMPRESSION == 'zstd' and zstandard is not None
+# Keeps ContentEncoding on managed copies, whose multipart path drops metadata
+ZSTD_COPY_ARGS = {'ContentEncoding': 'zstd', 'MetadataDirective': 'REPLACE'}
+
 
 def lambda_handler(event, context):
+    started = time.monotonic()
     try:
         # Parse the POST request body
         if 'body' not in event:
-            print('ERROR: Request body is missing')
             return create_response(400, {'error': 'Request body is missing'})
         
-        body = json.loads(event['body']) if isinstance(event['body'], str) else event['body']
+        body = loads(event['body']) if isinstance(event['body'], str) else event['body']
         
         # Validate required fields
         tenant_name = body.get('tenant_name')
         api_key = body.get('api_key')
         sql_query = body.get('sql_query')
+        params = body.get('params')
         
         if not tenant_name or not api_key or not sql_query:
-            print('ERROR: Missing required fields in request')
             return create_response(400, {
                 'error': 'Missing required fields. Please provide tenant_name, api_key, and sql_query'
             })
         
-        print(f'Processing write request for tenant: {tenant_name}')
+        # Signed tenant token: forged requests are turned away before any DynamoDB read
+        if not auth_token_valid(tenant_name, body.get('auth_token')):
+            log_event(logging.WARNING, 'invalid_auth_token', tenant=tenant_name)
+            return create_response(401, {
+                'error': 'Invalid auth token'
+            })
         
-        # Step 1: Query tenant metadata table using tenant_name index
-        tenant_table = dynamodb.Table(TENANT_METADATA_TABLE)
+        # Validate the statement shape before any metadata lookup or download
+        if params is None:
+            params = ()
+        elif not isinstance(params, (list, dict)):
+            return create_response(400, {
+                'error': 'params must be a list (positional) or an object (named)'
+            })
+        
+        if not isinstance(sql_query, str) or not sqlite3.complete_statement(sql_query + ';'):
+            return create_response(400, {
+                'error': 'sql_query is not a complete SQL statement'
+            })
+        
+        if body.get('batch', False) is not False:
+            return create_response(400, {
+                'error': 'Queued (batch) writes are not available in the standby region'
+            })
         
+        # Step 1: Query tenant metadata table using tenant_name index
         try:
-            response = tenant_table.query(
-                IndexName=TENANT_NAME_INDEX,
-                KeyConditionExpression=Key('tenant_name').eq(tenant_name)
-            )
+            tenant_item = lookup_tenant(tenant_name)
         except Exception as e:
-            print(f'ERROR: Failed to query tenant metadata: {str(e)}')
+            log_event(logging.ERROR, 'tenant_lookup_failed', tenant=tenant_name, error=str(e))
             return create_response(500, {
                 'error': f'Failed to query tenant metadata: {str(e)}'
             })
         
         # Check if tenant exists
-        if not response.get('Items'):
-            print(f'WARNING: Tenant not found: {tenant_name}')
+        if tenant_item is None:
+            log_event(logging.WARNING, 'tenant_not_found', tenant=tenant_name)
             return create_response(404, {
                 'error': f'Tenant "{tenant_name}" not found'
             })
         
-        tenant_item = response['Items'][0]
-        
         # Validate API key
-        if tenant_item.get('api_key') != api_key:
-            print(f'WARNING: Invalid API key for tenant: {tenant_name}')
+        if not api_key_matches(tenant_item.get('api_key_digest'), api_key):
+            # Re-read next time: the key may have just been rotated
+            _tenant_cache.pop(tenant_name, None)
+            log_event(logging.WARNING, 'invalid_api_key', tenant=tenant_name)
             return create_response(401, {
                 'error': 'Invalid API key'
             })
@@ -73,61 +154,56 @@ def lambda_handler(event, context):
         # Step 2: Get tenant_id from tenant metadata
         tenant_id = tenant_item.get('tenant_id')
         if not tenant_id:
-            print('ERROR: Tenant ID not found in metadata')
+            log_event(logging.ERROR, 'tenant_id_missing', tenant=tenant_name)
             return create_response(500, {
                 'error': 'Tenant ID not found in metadata'
             })
         
-        print(f'Tenant ID retrieved: {tenant_id}')
-        
-        # Step 3: Get replica metadata using tenant_id
-        replica_table = dynamodb.Table(REPLICA_METADATA_TABLE)
-        
-        try:
-            replica_response = replica_table.get_item(
-                Key={'tenantId': tenant_id}
-            )
-        except Exception as e:
-            print(f'ERROR: Failed to query replica metadata: {str(e)}')
-            return create_response(500, {
-                'error': f'Failed to query replica metadata: {str(e)}'
-            })
+        # Step 3: Get replica metadata. Tenants whose row already carries it
+        # (denormalized at provisioning) skip this DynamoDB round trip.
+        replica_item = embedded_replica_metadata(tenant_item)
+        if replica_item is None:
+            try:
+                replica_item = lookup_replica(tenant_id)
+            except Exception as e:
+                log_event(logging.ERROR, 'replica_lookup_failed', tenant_id=tenant_id, error=str(e))
+                return create_response(500, {
+                    'error': f'Failed to query replica metadata: {str(e)}'
+                })
         
-        if 'Item' not in replica_response:
-            print(f'ERROR: Replica metadata not found for tenant_id: {tenant_id}')
-            return create_response(404, {
-                'error': f'Replica metadata not found for tenant_id "{tenant_id}"'
-            })
+            if replica_item is None:
+                log_event(logging.ERROR, 'replica_not_found', tenant_id=tenant_id)
+                return create_response(404, {
+                    'error': f'Replica metadata not found for tenant_id "{tenant_id}"'
+                })
+            
+            # Older tenant: copy the fields onto its row so later lookups take one call
+            backfill_replica_fields(tenant_item, tenant_id, replica_item)
         
-        replica_item = replica_response['Item']
         primary_bucket = replica_item.get('standby_bucket')
         read_only_bucket = replica_item.get('read_only_bucket')
         standby_bucket = replica_item.get('primary_bucket')
         db_path = replica_item.get('db_path')
         
         if not primary_bucket or not db_path:
-            print('ERROR: Primary bucket or database path not found in replica metadata')
+            log_event(logging.ERROR, 'replica_location_missing', tenant_id=tenant_id)
             return create_response(500, {
                 'error': 'Primary bucket or database path not found in replica metadata'
             })
         
-        print(f'Retrieved metadata - Primary bucket: {primary_bucket}, DB path: {db_path}')
-        
-        # Step 4: Download DB file from primary S3 bucket, execute write query, and create snapshot
+        # Step 4: Download DB file from primary S3 bucket and execute write query
         tmp_db_path = None
-        snapshot_path = None
+        cache_key = (primary_bucket, db_path)
+        metadata_future = None
+        sns_future = None
         
         try:
-            # Create temporary file for the database
-            with tempfile.NamedTemporaryFile(delete=False, suffix='.db') as tmp_file:
-                tmp_db_path = tmp_file.name
-            
-            # Download the database file from primary S3 bucket
-            print(f'Downloading database from S3: {primary_bucket}/{db_path}')
+            # Fetch the database file from primary S3 bucket (or the warm /tmp copy)
             try:
-                s3.download_file(primary_bucket, db_path, tmp_db_path)
+                tmp_db_path = fetch_primary_db(primary_bucket, db_path, tenant_id)
+                fetched = time.monotonic()
             except Exception as e:
-                print(f'ERROR: Failed to download database from S3: {str(e)}')
+                log_event(logging.ERROR, 'db_fetch_failed', tenant_id=tenant_id, db_path=db_path, error=str(e))
                 return create_response(500, {
                     'error': f'Failed to download database from S3: {str(e)}'
                 })
@@ -135,25 +211,23 @@ def lambda_handler(event, context):
             # Execute write query
             try:
                 conn = sqlite3.connect(tmp_db_path)
+                # The /tmp copy is re-fetched after any failure, so the rollback
+                # journal only needs to survive the statement, not a crash
+                conn.execute('PRAGMA journal_mode = MEMORY')
+                conn.execute('PRAGMA synchronous = NORMAL')
                 cursor = conn.cursor()
                 
                 try:
-                    print(f'Executing SQL query: {sql_query[:100]}...')
-                    cursor.execute(sql_query)
+                    cursor.execute(sql_query, params)
                     conn.commit()
                     rows_affected = cursor.rowcount
-                    print(f'SQL query executed successfully. Rows affected: {rows_affected}')
+                    executed = time.monotonic()
                     
-                    # Create snapshot using VACUUM INTO
+                    # Snapshot name; the snapshot itself is copied server-side after upload
                     timestamp = datetime.utcnow().strftime('%Y%m%d_%H%M%S')
                     snapshot_filename = f'{tenant_id}_snapshot_{timestamp}.db'
-                    snapshot_path = f'/tmp/{snapshot_filename}'
-                    
-                    print(f'Creating database snapshot: {snapshot_path}')
-                    cursor.execute(f"VACUUM INTO '{snapshot_path}';")
                     
                 except sqlite3.Error as e:
-                    print(f'ERROR: SQL query execution failed: {str(e)}')
                     return create_response(400, {
                         'error': f'SQL query execution failed: {str(e)}'
                     })
@@ -162,84 +236,77 @@ def lambda_handler(event, context):
                     conn.close()
                 
             except Exception as e:
-                print(f'ERROR: Database connection error: {str(e)}')
+                log_event(logging.ERROR, 'db_connect_failed', tenant_id=tenant_id, error=str(e))
                 return create_response(500, {
                     'error': f'Database connection error: {str(e)}'
                 })
             
             # Upload modified database back to primary bucket
             try:
-                print(f'Uploading modified database to S3: {primary_bucket}/{db_path}')
-                s3.upload_file(tmp_db_path, primary_bucket, db_path)
+                uploaded_etag, snapshot_size = upload_primary_db(tmp_db_path, primary_bucket, db_path)
+                cache_primary_db(cache_key, tmp_db_path, uploaded_etag)
+                uploaded = time.monotonic()
             except Exception as e:
-                print(f'ERROR: Failed to upload modified database to S3: {str(e)}')
+                log_event(logging.ERROR, 'db_upload_failed', tenant_id=tenant_id, db_path=db_path, error=str(e))
                 return create_response(500, {
                     'error': f'Failed to upload modified database to S3: {str(e)}'
                 })
             
-            # Upload snapshot to S3 in replication_snapshots folder
+            # Step 6 starts as soon as the database is uploaded: last_updated_at is
+            # written while the snapshot is copied and announced
+            current_timestamp = datetime.utcnow().isoformat()
+            metadata_future = _executor.submit(update_replica_timestamp, tenant_id, current_timestamp)
+            
+            # Copy the uploaded database to the replication_snapshots folder (server-side)
             snapshot_s3_key = f'replication_snapshots/{snapshot_filename}'
             try:
-                print(f'Uploading snapshot to S3: {primary_bucket}/{snapshot_s3_key}')
-                s3.upload_file(snapshot_path, primary_bucket, snapshot_s3_key)
-                print('Snapshot uploaded to S3 successfully')
+                copy_s3_object(
+                    s3, primary_bucket, db_path, snapshot_s3_key, snapshot_size,
+                    ExtraArgs=ZSTD_COPY_ARGS if COMPRESS_DB else None, Config=TRANSFER_CONFIG
+                )
             except Exception as e:
-                print(f'ERROR: Failed to upload snapshot to S3: {str(e)}')
+                log_event(logging.ERROR, 'snapshot_copy_failed', tenant_id=tenant_id, snapshot_s3_key=snapshot_s3_key, error=str(e))
                 return create_response(500, {
                     'error': f'Failed to upload snapshot to S3: {str(e)}'
                 })
             
-            # Step 5: Send notification to SNS
+            # Step 5: Send notification to SNS, overlapped with the step 6 metadata update
             if SNS_TOPIC_ARN:
-                try:
-                    sns_message = {
-                        'tenant_name': tenant_name,
-                        'tenant_id': tenant_id,
-                        'snapshot_bucket': primary_bucket,
-                        'snapshot_s3_key': snapshot_s3_key,
-                        'snapshot_filename': snapshot_filename,
-                        'primary_bucket': primary_bucket,
-                        'db_path': db_path,
-                        'read_only_bucket': read_only_bucket,
-                        'standby_bucket': standby_bucket,
-                        'timestamp': datetime.utcnow().isoformat(),
-                        'rows_affected': rows_affected
-                    }
-                    
-                    print(f'Publishing message to SNS topic: {SNS_TOPIC_ARN}')
-                    sns.publish(
-                        TopicArn=SNS_TOPIC_ARN,
-                        Message=json.dumps(sns_message),
-                        Subject=f'Database Write Notification - {tenant_name}'
-                    )
-                    print('SNS message published successfully')
-                    
-                except Exception as e:
-                    print(f'ERROR: Failed to publish to SNS: {str(e)}')
-                    # Don't return error here, continue with the process
+                sns_message = {
+                    'tenant_name': tenant_name,
+                    'tenant_id': tenant_id,
+                    'snapshot_bucket': primary_bucket,
+                    'snapshot_s3_key': snapshot_s3_key,
+                    'snapshot_filename': snapshot_filename,
+                    'snapshot_size': snapshot_size,
+                    'content_encoding': 'zstd' if COMPRESS_DB else None,
+                    'primary_bucket': primary_bucket,
+                    'db_path': db_path,
+                    'read_only_bucket': read_only_bucket,
+                    'standby_bucket': standby_bucket,
+                    'timestamp': datetime.utcnow().isoformat(),
+                    'rows_affected': rows_affected
+                }
+                sns_future = _executor.submit(publish_write_notification, sns_message, tenant_name)
             
-            # Step 6: Update replica metadata table with last_updated_at timestamp
+            # Step 6: Wait for the replica metadata update started after the upload
             try:
-                current_timestamp = datetime.utcnow().isoformat()
-                print(f'Updating replica metadata with last_updated_at: {current_timestamp}')
-                
-                replica_table.update_item(
-                    Key={'tenantId': tenant_id},
-                    UpdateExpression='SET last_updated_at = :timestamp',
-                    ExpressionAttributeValues={
-                        ':timestamp': current_timestamp
-                    }
-                )
-                print('Replica metadata updated successfully')
+                metadata_future.result()
                 
             except Exception as e:
-                print(f'ERROR: Failed to update replica metadata: {str(e)}')
+                log_event(logging.ERROR, 'replica_metadata_update_failed', tenant_id=tenant_id, error=str(e))
                 return create_response(500, {
                     'error': f'Failed to update replica metadata: {str(e)}'
                 })
             
             # Step 7 & 8: Return success response
-            print(f'Write operation completed successfully for tenant: {tenant_name}')
+            log_event(
+                logging.INFO, 'write', tenant_id=tenant_id, rows_affected=rows_affected,
+                fetch_ms=round((fetched - started) * 1000, 1),
+                query_ms=round((executed - fetched) * 1000, 1),
+                upload_ms=round((uploaded - executed) * 1000, 1),
+                total_ms=round((time.monotonic() - started) * 1000, 1)
+            )
             return create_response(200, {
                 'success': True,
                 'message': 'Write operation completed successfully',
@@ -250,33 +317,238 @@ def lambda_handler(event, context):
             })
             
         finally:
-            # Clean up temporary files
-            if tmp_db_path and os.path.exists(tmp_db_path):
-                try:
-                    os.unlink(tmp_db_path)
-                    print('Temporary database file cleaned up')
-                except Exception as e:
-                    print(f'WARNING: Failed to delete temporary file {tmp_db_path}: {str(e)}')
+            # Never return with background work still running: the environment
+            # is frozen as soon as the handler returns
+            wait([future for future in (metadata_future, sns_future) if future])
             
-            if snapshot_path and os.path.exists(snapshot_path):
+            # Clean up the local copy unless it was cached as the uploaded version
+            if tmp_db_path and cache_key not in _DB_CACHE and os.path.exists(tmp_db_path):
                 try:
-                    os.unlink(snapshot_path)
-                    print('Temporary snapshot file cleaned up')
+                    os.unlink(tmp_db_path)
                 except Exception as e:
-                    print(f'WARNING: Failed to delete temporary snapshot file {snapshot_path}: {str(e)}')
+                    log_event(logging.WARNING, 'tmp_cleanup_failed', path=tmp_db_path, error=str(e))
     
-    except json.JSONDecodeError as e:
-        print(f'ERROR: Invalid JSON in request body: {str(e)}')
+    except json.JSONDecodeError:
         return create_response(400, {
             'error': 'Invalid JSON in request body'
         })
     except Exception as e:
-        print(f'ERROR: Unexpected error: {str(e)}')
+        log_event(logging.ERROR, 'unexpected_error', error=str(e))
         return create_response(500, {
             'error': f'Unexpected error: {str(e)}'
         })
 
 
+def update_replica_timestamp(tenant_id, timestamp):
+    """Record the write time on the tenant's replica metadata row"""
+    REPLICA_TABLE.update_item(
+        Key={'tenantId': tenant_id},
+        UpdateExpression='SET last_updated_at = :timestamp',
+        ExpressionAttributeValues={
+            ':timestamp': timestamp
+        }
+    )
+
+
+def publish_write_notification(sns_message, tenant_name):
+    """Publish the write to SNS; failures are logged, not raised"""
+    try:
+        sns.publish(
+            TopicArn=SNS_TOPIC_ARN,
+            Message=dumps(sns_message),
+            Subject=f'Database Write Notification - {tenant_name}'
+        )
+    except Exception as e:
+        log_event(logging.ERROR, 'sns_publish_failed', tenant=tenant_name, error=str(e))
+
+
+def fetch_primary_db(bucket, key, tenant_id):
+    """
+    Return a local path holding the current primary DB, reusing the /tmp copy
+    while its ETag is unchanged. The entry is taken out of the cache until the
+    write is uploaded, so a failed write never leaves a diverged copy cached.
+    """
+    head = s3.head_object(Bucket=bucket, Key=key)
+    etag = head['ETag']
+    cached = _DB_CACHE.pop((bucket, key), None)
+    if cached and cached[0] == etag and os.path.exists(cached[1]):
+        return cached[1]
+
+    local_path = os.path.join(DB_CACHE_DIR, f'{tenant_id}.db')
+    if head.get('ContentEncoding') == 'zstd':
+        download_zstd(s3, bucket, key, local_path)
+    else:
+        download_preallocated(bucket, key, local_path, head['ContentLength'])
+    return local_path
+
+
+def download_preallocated(bucket, key, local_path, size):
+    """
+    Download to local_path through a .part file preallocated at the object's
+    size: the concurrent ranged GETs write into allocated extents instead of
+    growing the file, and the rename never exposes a half-written copy
+    """
+    part_path = local_path + '.part'
+    try:
+        with open(part_path, 'wb') as f:
+            try:
+                os.posix_fallocate(f.fileno(), 0, size)
+            except (AttributeError, OSError):
+                pass  # Empty object or no fallocate here: download without it
+            s3.download_fileobj(bucket, key, f, Config=TRANSFER_CONFIG)
+        os.replace(part_path, local_path)
+    except Exception:
+        if os.path.exists(part_path):
+            os.unlink(part_path)
+        raise
+
+
+def upload_primary_db(local_path, bucket, key):
+    """
+    Upload the DB, zstd-compressed when COMPRESS_DB is set, and return
+    (ETag S3 will assign, uploaded size)
+    """
+    if not COMPRESS_DB:
+        s3.upload_file(local_path, bucket, key, Config=TRANSFER_CONFIG)
+        return upload_etag(local_path), os.path.getsize(local_path)
+
+    zst_path = local_path + '.zst'
+    try:
+        with open(local_path, 'rb') as src, open(zst_path, 'wb') as dst:
+            compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL, threads=-1)
+            compressor.copy_stream(src, dst, size=os.path.getsize(local_path))
+        s3.upload_file(zst_path, bucket, key, ExtraArgs={'ContentEncoding': 'zstd'}, Config=TRANSFER_CONFIG)
+        return upload_etag(zst_path), os.path.getsize(zst_path)
+    finally:
+        if os.path.exists(zst_path):
+            os.unlink(zst_path)
+
+
+def cache_primary_db(cache_key, local_path, etag):
+    """Record the uploaded copy, evicting the oldest ones to stay under DB_CACHE_MAX_BYTES"""
+    size = os.path.getsize(local_path)
+    cached_bytes = sum(entry[2] for entry in _DB_CACHE.values())
+    while _DB_CACHE and cached_bytes + size > DB_CACHE_MAX_BYTES:
+        _, old_path, old_size = _DB_CACHE.pop(next(iter(_DB_CACHE)))
+        cached_bytes -= old_size
+        if old_path != local_path and os.path.exists(old_path):
+            os.unlink(old_path)
+    _DB_CACHE[cache_key] = (etag, local_path, size)
+
+
+def upload_etag(path):
+    """
+    ETag S3 assigns to `path` uploaded with TRANSFER_CONFIG: the MD5 for a single
+    PUT, the MD5 of the part MD5s plus '-<parts>' for multipart. Computed locally
+    rather than read back, since a HEAD after upload could see a concurrent
+    writer's object. (With SSE-KMS it never matches, which only costs a download.)
+    """
+    size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        if size < TRANSFER_CONFIG.multipart_threshold:
+            return f'"{hashlib.md5(f.read()).hexdigest()}"'
+        chunk = TRANSFER_CONFIG.multipart_chunksize
+        digests = [hashlib.md5(part).digest() for part in iter(lambda: f.read(chunk), b'')]
+    return f'"{hashlib.md5(b"".join(digests)).hexdigest()}-{len(digests)}"'
+
+
+def lookup_tenant(tenant_name):
+    """Tenant row for tenant_name, or None; reused across warm invocations for METADATA_CACHE_TTL_SECONDS"""
+    item = cache_get(_tenant_cache, tenant_name)
+    if item is None:
+        response = TENANT_TABLE.query(
+            IndexName=TENANT_NAME_INDEX,
+            KeyConditionExpression=Key('tenant_name').eq(tenant_name)
+        )
+        if not response.get('Items'):
+            return None
+        item = response['Items'][0]
+        api_key = item.pop('api_key', None)
+        item['api_key_digest'] = api_key_digest(api_key) if api_key else None
+        cache_put(_tenant_cache, tenant_name, item)
+    return item
+
+
+def lookup_replica(tenant_id):
+    """Replica metadata row for tenant_id, or None; cached like lookup_tenant"""
+    item = cache_get(_replica_cache, tenant_id)
+    if item is None:
+        response = REPLICA_TABLE.get_item(
+            Key={'tenantId': tenant_id}
+        )
+        if 'Item' not in response:
+            return None
+        item = response['Item']
+        cache_put(_replica_cache, tenant_id, item)
+    return item
+
+
+def cache_get(cache, key):
+    entry = cache.get(key)
+    if entry and entry[0] > time.monotonic():
+        return entry[1]
+    cache.pop(key, None)
+    return None
+
+
+def cache_put(cache, key, value):
+    cache.pop(key, None)
+    while len(cache) >= METADATA_CACHE_SIZE:
+        cache.pop(next(iter(cache)))
+    cache[key] = (time.monotonic() + METADATA_CACHE_TTL_SECONDS, value)
+
+
+def backfill_replica_fields(tenant_item, tenant_id, replica_item):
+    """Copy the replica buckets and db_path onto a tenant row that predates the denormalized fields"""
+    if not all(replica_item.get(field) for field in ('primary_bucket', 'standby_bucket', 'read_only_bucket', 'db_path')):
+        return
+    try:
+        TENANT_TABLE.update_item(
+            Key={'tenant_id': tenant_id},
+            UpdateExpression='SET primary_bucket = if_not_exists(primary_bucket, :primary), '
+                             'standby_bucket = if_not_exists(standby_bucket, :standby), '
+                             'read_only_bucket = if_not_exists(read_only_bucket, :read_only), '
+                             'current_db_path = if_not_exists(current_db_path, :db_path)',
+            ConditionExpression='attribute_exists(tenant_id)',
+            ExpressionAttributeValues={
+                ':primary': replica_item['primary_bucket'],
+                ':standby': replica_item['standby_bucket'],
+                ':read_only': replica_item['read_only_bucket'],
+                ':db_path': replica_item['db_path']
+            }
+        )
+        # The cached row takes the single-call path from now on too
+        for field in ('primary_bucket', 'standby_bucket', 'read_only_bucket'):
+            tenant_item.setdefault(field, replica_item[field])
+        tenant_item.setdefault('current_db_path', replica_item['db_path'])
+    except Exception as e:
+        log_event(logging.WARNING, 'replica_backfill_failed', tenant_id=tenant_id, error=str(e))
+
+
+def embedded_replica_metadata(tenant_item):
+    """Replica fields copied onto the tenant row at provisioning, or None for older tenants"""
+    if not all(tenant_item.get(field) for field in ('primary_bucket', 'standby_bucket', 'current_db_path')):
+        return None
+    return {
+        'primary_bucket': tenant_item['primary_bucket'],
+        'read_only_bucket': tenant_item.get('read_only_bucket'),
+        'standby_bucket': tenant_item.get('standby_bucket'),
+        'db_path': tenant_item['current_db_path']
+    }
+
+
+def api_key_digest(api_key):
+    """Salted SHA-256 of an API key, the only form kept in the tenant cache"""
+    return hashlib.sha256(_API_KEY_SALT + str(api_key).encode('utf-8')).digest()
+
+
+def api_key_matches(expected_digest, provided):
+    """Constant-time check of a provided API key against the tenant's cached digest"""
+    if not expected_digest or not provided:
+        return False
+    return hmac.compare_digest(expected_digest, api_key_digest(provided))
+
+
 def create_response(status_code, body):
     """Helper function to create standardized API responses"""
     return {
@@ -287,5 +559,5 @@ def create_response(status_code, body):
             'Access-Control-Allow-Headers': 'Content-Type,X-Amz-Date,Authorization,X-Api-Key,X-Amz-Security-Token',
             'Access-Control-Allow-Methods': 'POST,OPTIONS'
         },
-        'body': json.dumps(body)
+        'body': dumps(body)
     }
@@ -1,7 +1,7 @@
 import json
 import boto3
-import tempfile
 import os
+from octodb_shared import loads, remove_tmp_db, tenant_tmp_path
 
 # Initialize AWS clients
 read_only_s3 = boto3.client('s3', region_name='us-east-1')
@@ -20,12 +20,12 @@ def lambda_handler(event, context):
     for record in event['Records']:
         try:
             # Parse the SQS message body (which contains the SNS message)
-            message_body = json.loads(record['body'])
+            message_body = loads(record['body'])
             
             # Extract the actual SNS message
             if 'Message' in message_body:
                 # Message came through SNS -> SQS
-                sns_message = json.loads(message_body['Message'])
+                sns_message = loads(message_body['Message'])
             else:
                 # Direct SQS message (fallback)
                 sns_message = message_body
@@ -37,6 +37,7 @@ def lambda_handler(event, context):
             snapshot_bucket = sns_message.get('snapshot_bucket')
             snapshot_s3_key = sns_message.get('snapshot_s3_key')
             db_path = sns_message.get('db_path')
+            content_encoding = sns_message.get('content_encoding')
             read_only_bucket = sns_message.get('read_only_bucket')
             rows_affected = sns_message.get('rows_affected')
             timestamp = sns_message.get('timestamp')
@@ -60,10 +61,11 @@ def lambda_handler(event, context):
             try:
                 print(f'Step 2: Downloading snapshot from S3...')
                 
-                with tempfile.NamedTemporaryFile(delete=False, suffix='.db') as tmp_file:
-                    tmp_snapshot_path = tmp_file.name
+                tmp_snapshot_path = tenant_tmp_path(tenant_id)
+                part_path = tmp_snapshot_path + '.part'
                 
-                primary_s3.download_file(snapshot_bucket, snapshot_s3_key, tmp_snapshot_path)
+                primary_s3.download_file(snapshot_bucket, snapshot_s3_key, part_path)
+                os.replace(part_path, tmp_snapshot_path)
                 
             except Exception as e:
                 print(f'ERROR: Failed to download snapshot from S3: {str(e)}')
@@ -73,7 +75,9 @@ def lambda_handler(event, context):
             try:
                 print(f'Step 3: Uploading to read-only bucket...')
                 
-                read_only_s3.upload_file(tmp_snapshot_path, read_only_bucket, db_path)
+                # Compressed snapshots stay compressed; readers decode by ContentEncoding
+                extra_args = {'ContentEncoding': content_encoding} if content_encoding else None
+                read_only_s3.upload_file(tmp_snapshot_path, read_only_bucket, db_path, ExtraArgs=extra_args)
                 
                 print(f'Snapshot uploaded successfully to read-only bucket')
                 
@@ -83,12 +87,9 @@ def lambda_handler(event, context):
             
             finally:
                 # Clean up temporary file
-                if tmp_snapshot_path and os.path.exists(tmp_snapshot_path):
-                    try:
-                        os.unlink(tmp_snapshot_path)
-                        print('Temporary snapshot file cleaned up')
-                    except Exception as e:
-                        print(f'WARNING: Failed to delete temporary file {tmp_snapshot_path}: {str(e)}')
+                if tmp_snapshot_path:
+                    remove_tmp_db(tmp_snapshot_path)
+                    print('Temporary snapshot file cleaned up')
             
             print(f'REPLICATION COMPLETED SUCCESSFULLY')
             print(f'  Tenant: {tenant_name} ({tenant_id})')
@@ -112,4 +113,3 @@ def lambda_handler(event, context):
             'records_processed': len(event.get('Records', []))
         })
     }
-
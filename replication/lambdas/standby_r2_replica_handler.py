@@ -1,12 +1,23 @@
 import json
 import boto3
-import tempfile
-import os
+from boto3.s3.transfer import TransferConfig
+from concurrent.futures import ThreadPoolExecutor
+from octodb_shared import loads
 
 # Initialize AWS clients
 s3_primary = boto3.client('s3', region_name='us-east-2')
 s3_standby = boto3.client('s3', region_name='us-east-1')
 
+# Managed server-side copy: single CopyObject below the threshold, concurrent
+# UploadPartCopy above it; no snapshot bytes pass through the Lambda
+COPY_CONFIG = TransferConfig(
+    multipart_threshold=64 * 1024 * 1024,
+    max_concurrency=16
+)
+
+# Upper bound on destinations replicated in parallel per SQS batch
+MAX_WORKERS = 10
+
 
 def lambda_handler(event, context):
     """
@@ -16,20 +27,50 @@ def lambda_handler(event, context):
     
     print(f'Received event with {len(event.get("Records", []))} record(s)')
     
-    # Process each SQS message
+    # Parse every message once and group by destination object: snapshots for the
+    # same DB must land in queue order, different DBs are copied concurrently
+    groups = {}
     for record in event['Records']:
         try:
-            # Parse the SQS message body (which contains the SNS message)
-            message_body = json.loads(record['body'])
-            
-            # Extract the actual SNS message
-            if 'Message' in message_body:
-                # Message came through SNS -> SQS
-                sns_message = json.loads(message_body['Message'])
-            else:
-                # Direct SQS message (fallback)
-                sns_message = message_body
-            
+            sns_message = parse_sns_message(record)
+        except json.JSONDecodeError as e:
+            print(f'ERROR: Failed to parse message JSON: {str(e)}')
+            print(f'Raw message: {record.get("body", "N/A")}')
+            continue
+        destination = (sns_message.get('standby_bucket'), sns_message.get('db_path'))
+        groups.setdefault(destination, []).append((record, sns_message))
+    
+    if groups:
+        with ThreadPoolExecutor(max_workers=min(MAX_WORKERS, len(groups))) as executor:
+            futures = [executor.submit(replicate_in_order, items) for items in groups.values()]
+        # Re-raise the first failure to trigger SQS retry mechanism
+        for future in futures:
+            future.result()
+    
+    return {
+        'statusCode': 200,
+        'body': json.dumps({
+            'message': 'R2 standby replication processing completed',
+            'records_processed': len(event.get('Records', []))
+        })
+    }
+
+
+def parse_sns_message(record):
+    # Parse the SQS message body (which contains the SNS message)
+    message_body = loads(record['body'])
+    
+    # Extract the actual SNS message
+    if 'Message' in message_body:
+        # Message came through SNS -> SQS
+        return loads(message_body['Message'])
+    # Direct SQS message (fallback)
+    return message_body
+
+
+def replicate_in_order(items):
+    for record, sns_message in items:
+        try:
             # Step 1: Print message details
             tenant_name = sns_message.get('tenant_name')
             tenant_id = sns_message.get('tenant_id')
@@ -39,6 +80,8 @@ def lambda_handler(event, context):
             db_path = sns_message.get('db_path')
             standby_bucket = sns_message.get('standby_bucket')
             rows_affected = sns_message.get('rows_affected')
+            snapshot_size = sns_message.get('snapshot_size')
+            content_encoding = sns_message.get('content_encoding')
             timestamp = sns_message.get('timestamp')
             
             print('R2 STANDBY REPLICATION REQUEST RECEIVED')
@@ -56,61 +99,45 @@ def lambda_handler(event, context):
                 print('ERROR: Missing required fields in message')
                 raise ValueError('Missing required fields: snapshot_bucket, snapshot_s3_key, standby_bucket, or db_path')
             
-            # Download snapshot file from primary bucket (us-east-1)
-            tmp_snapshot_path = None
+            # Server-side copy from the primary bucket (us-east-2) into the standby bucket
+            # (us-east-1); no snapshot bytes pass through the Lambda
             try:
-                print(f'Step 2: Downloading snapshot from S3...')
+                print(f'Step 2: Copying snapshot to standby bucket...')
                 
-                with tempfile.NamedTemporaryFile(delete=False, suffix='.db') as tmp_file:
-                    tmp_snapshot_path = tmp_file.name
+                copy_source = {'Bucket': snapshot_bucket, 'Key': snapshot_s3_key}
+                if snapshot_size is not None and snapshot_size < COPY_CONFIG.multipart_threshold:
+                    # Size published by the writer: one CopyObject, no HeadObject first
+                    s3_standby.copy_object(CopySource=copy_source, Bucket=standby_bucket, Key=db_path)
+                else:
+                    # Unknown or large: managed copy heads the source and switches
+                    # to parallel UploadPartCopy above the threshold. That path drops
+                    # object metadata, so a compressed snapshot's encoding is re-set.
+                    extra_args = None
+                    if content_encoding:
+                        extra_args = {'ContentEncoding': content_encoding, 'MetadataDirective': 'REPLACE'}
+                    s3_standby.copy(
+                        copy_source,
+                        standby_bucket,
+                        db_path,
+                        ExtraArgs=extra_args,
+                        SourceClient=s3_primary,
+                        Config=COPY_CONFIG
+                    )
                 
-                s3_primary.download_file(snapshot_bucket, snapshot_s3_key, tmp_snapshot_path)
+                print(f'Snapshot copied successfully to standby bucket')
                 
             except Exception as e:
-                print(f'ERROR: Failed to download snapshot from S3: {str(e)}')
+                print(f'ERROR: Failed to copy snapshot to standby bucket: {str(e)}')
                 raise
             
-            # Upload snapshot to standby bucket (us-east-2)
-            try:
-                print(f'Step 3: Uploading to standby bucket...')
-                
-                s3_standby.upload_file(tmp_snapshot_path, standby_bucket, db_path)
-                
-                print(f'Snapshot uploaded successfully to standby bucket')
-                
-            except Exception as e:
-                print(f'ERROR: Failed to upload snapshot to standby bucket: {str(e)}')
-                raise
-            
-            finally:
-                # Clean up temporary file
-                if tmp_snapshot_path and os.path.exists(tmp_snapshot_path):
-                    try:
-                        os.unlink(tmp_snapshot_path)
-                        print('Temporary snapshot file cleaned up')
-                    except Exception as e:
-                        print(f'WARNING: Failed to delete temporary file {tmp_snapshot_path}: {str(e)}')
-            
             # Replication completed
             print(f'R2 STANDBY REPLICATION COMPLETED SUCCESSFULLY')
             print(f'  Tenant: {tenant_name} ({tenant_id})')
             print(f'  File: {snapshot_filename}')
             print(f'  Replicated to: {standby_bucket}/{db_path}')
             
-        except json.JSONDecodeError as e:
-            print(f'ERROR: Failed to parse message JSON: {str(e)}')
-            print(f'Raw message: {record.get("body", "N/A")}')
-            
         except Exception as e:
             print(f'ERROR: Replication failed: {str(e)}')
             print(f'Message details: {record.get("body", "N/A")}')
             # Re-raise to trigger SQS retry mechanism
             raise
-    
-    return {
-        'statusCode': 200,
-        'body': json.dumps({
-            'message': 'R2 standby replication processing completed',
-            'records_processed': len(event.get('Records', []))
-        })
-    }